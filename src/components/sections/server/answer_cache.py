@@ -0,0 +1,134 @@
+# answer_cache.py
+# Full-response cache for /api/query. Entries are keyed on everything that
+# determines the LLM answer: the normalized question, the retrieved KB ids, the
+# model and the KB version. An optional SQLite file lets entries survive restarts.
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Sequence
+
+from cache import TTLCache, normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+def file_fingerprint(*paths) -> str:
+    h = hashlib.sha256()
+    for p in paths:
+        p = Path(p)
+        h.update(p.name.encode("utf-8"))
+        with open(p, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    return h.hexdigest()[:16]
+
+
+def answer_key(question: str, item_ids: Sequence[str], model: str, kb_version: str) -> str:
+    payload = json.dumps([normalize_query(question), list(item_ids), model, kb_version],
+                         ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    def __init__(self, kb_version: str, max_entries: int = 1024, ttl_seconds: float = 0.0,
+                 path: Optional[str] = None):
+        self.kb_version = kb_version
+        self.max_entries = int(max_entries)
+        self.ttl_seconds = float(ttl_seconds)
+        self._mem = TTLCache(max_entries, ttl_seconds,
+                             sizeof=lambda v: len(v["answer"].encode("utf-8")))
+        self._db = None
+        self._db_lock = threading.Lock()
+        self.disk_hits = 0
+        if path and self.max_entries > 0:
+            self._open_db(path)
+
+    def _open_db(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " key TEXT PRIMARY KEY, kb_version TEXT NOT NULL, answer TEXT NOT NULL,"
+            " sources TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS answers_accessed ON answers(accessed_at)")
+        self._db = db
+        self._drop_other_versions()
+
+    def _drop_other_versions(self):
+        # Rows built against another KB version can never be hit again.
+        with self._db_lock:
+            removed = self._db.execute("DELETE FROM answers WHERE kb_version != ?", (self.kb_version,)).rowcount
+        if removed:
+            logger.info("Answer cache: dropped %d entries from previous KB versions", removed)
+
+    def set_version(self, kb_version: str):
+        # Called when a new KB is swapped in: every cached answer is now stale.
+        if kb_version == self.kb_version:
+            return
+        self.kb_version = kb_version
+        self._mem.clear()
+        if self._db is not None:
+            self._drop_other_versions()
+
+    def key(self, question: str, item_ids: Sequence[str], model: str, kb_version: Optional[str] = None) -> str:
+        return answer_key(question, item_ids, model, kb_version or self.kb_version)
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self._mem.get(key)
+        if entry is not None or self._db is None:
+            return entry
+        now = time.time()
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT answer, sources, created_at FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            answer, sources, created_at = row
+            if self.ttl_seconds > 0 and created_at + self.ttl_seconds <= now:
+                self._db.execute("DELETE FROM answers WHERE key = ?", (key,))
+                return None
+            self._db.execute("UPDATE answers SET accessed_at = ? WHERE key = ?", (now, key))
+            self.disk_hits += 1
+        entry = {"answer": answer, "sources": json.loads(sources)}
+        remaining = created_at + self.ttl_seconds - now if self.ttl_seconds > 0 else None
+        self._mem.set(key, entry, ttl_seconds=remaining)
+        return entry
+
+    def set(self, key: str, answer: str, sources: Sequence[str]):
+        entry = {"answer": answer, "sources": list(sources)}
+        self._mem.set(key, entry)
+        if self._db is None:
+            return
+        now = time.time()
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?)",
+                (key, self.kb_version, answer, json.dumps(entry["sources"], ensure_ascii=False), now, now),
+            )
+            self._db.execute(
+                "DELETE FROM answers WHERE key IN ("
+                " SELECT key FROM answers ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self):
+        self._mem.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM answers")
+
+    def stats(self) -> dict:
+        out = self._mem.stats()
+        out["kb_version"] = self.kb_version
+        if self._db is not None:
+            with self._db_lock:
+                out["disk_entries"] = self._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            out["disk_hits"] = self.disk_hits
+        return out
@@ -0,0 +1,293 @@
+# asgi.py
+# Async serving mode. Reuses the retrieval pipeline from server.py but serves it
+# from an ASGI app: LLM calls go through the async OpenAI client, so an in-flight
+# completion holds no thread, and blocking work (embedding, scoring, the SQLite
+# answer cache) runs on a bounded thread pool.
+#
+#   uvicorn asgi:app --host 0.0.0.0 --port 5174 --workers 2
+#   python asgi.py            # same, configured from the environment
+import asyncio
+import contextvars
+import logging
+import time
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import metrics
+import server
+from kb_registry import UnknownKB
+from metrics import span, trace_request
+
+# --- Config ---
+# Threads that may block on retrieval at once; with micro-batching enabled this
+# also bounds how many queries can share one encode call.
+EMBED_THREADS = int(os.environ.get("EMBED_THREADS", 16))
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=EMBED_THREADS, thread_name_prefix="embed")
+
+async def run_blocking(fn, *args):
+    # Runs in the caller's context so metrics spans land on the request's trace.
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, ctx.run, fn, *args)
+
+# --- Async OpenAI helpers ---
+# Both go through server.llm, whose semaphore (LLM_MAX_CONCURRENCY), retries
+# and hedging apply to async calls as well.
+async def acall_openai_chat(prompt: str, model: str = server.OPENAI_MODEL, timeout: int = 60):
+    with span("llm"):
+        return await server.llm.acomplete(server.build_messages(prompt), **server.llm_params(model, timeout))
+
+async def astream_openai_chat(prompt: str, model: str = server.OPENAI_MODEL, timeout: int = 60):
+    tokens = server.llm.astream(server.build_messages(prompt), **server.llm_params(model, timeout))
+    try:
+        async for delta in tokens:
+            yield delta
+    finally:
+        await tokens.aclose()
+
+# --- Routes ---
+async def home(request: Request):
+    html = """
+    <!doctype html>
+    <html>
+      <head><meta charset="utf-8"><title>Backend is running</title></head>
+      <body>
+        <h1>ASGI backend is running</h1>
+        <p>This server exposes a POST endpoint <code>/api/query</code> for the chatbot.</p>
+        <p>Streaming (Server-Sent Events) answers are available from <code>/api/query/stream</code>.</p>
+      </body>
+    </html>
+    """
+    return HTMLResponse(html)
+
+async def favicon(request: Request):
+    return Response(status_code=204)
+
+async def healthz(request: Request):
+    return JSONResponse({"status": "ok"})
+
+async def readyz(request: Request):
+    ready, details = server.readiness()
+    return JSONResponse(details, status_code=200 if ready else 503)
+
+async def prometheus_metrics(request: Request):
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+async def api_cache_stats(request: Request):
+    return JSONResponse(server.cache_stats())
+
+async def read_json(request: Request) -> dict:
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    return data if isinstance(data, dict) else {}
+
+async def parse_query_request(request: Request):
+    data = await read_json(request)
+    question = (data.get("question") or "").strip()
+    top_k = int(data.get("top_k", server.TOP_K))
+    return question, top_k, bool(data.get("timing")), server.kb_param(data, request.query_params)
+
+async def api_query(request: Request):
+    if request.method == "GET":
+        return JSONResponse({"error": "POST JSON required"}, status_code=400)
+    if "text/event-stream" in request.headers.get("accept", ""):
+        return await api_query_stream(request)
+
+    question, top_k, want_timing, kb_name = await parse_query_request(request)
+    if not question:
+        return JSONResponse({"error": "Missing question"}, status_code=400)
+
+    with trace_request() as trace:
+        try:
+            plan = await run_blocking(server.prepare_query, question, top_k, kb_name)
+            if "prompt" not in plan:
+                result = dict(plan)
+            else:
+                answer = (await acall_openai_chat(plan["prompt"], model=server.OPENAI_MODEL,
+                                                  timeout=server.OLLAMA_TIMEOUT)).strip()
+                await run_blocking(server.record_answer, plan, answer)
+                result = {"answer": answer, "sources": plan["sources"]}
+        except UnknownKB as e:
+            return JSONResponse(server.unknown_kb_error(e), status_code=404)
+        except Exception as e:
+            logger.exception("Unhandled error")
+            return JSONResponse({"error": str(e)}, status_code=500)
+        if want_timing:
+            result["timing"] = trace.as_ms()
+        return JSONResponse(result)
+
+async def api_query_stream(request: Request):
+    question, top_k, want_timing, kb_name = await parse_query_request(request)
+    if not question:
+        return JSONResponse({"error": "Missing question"}, status_code=400)
+
+    with trace_request() as trace:
+        try:
+            plan = await run_blocking(server.prepare_query, question, top_k, kb_name)
+        except UnknownKB as e:
+            return JSONResponse(server.unknown_kb_error(e), status_code=404)
+        except Exception as e:
+            logger.exception("Unhandled error")
+            return JSONResponse({"error": str(e)}, status_code=500)
+
+    def done_event(payload):
+        if want_timing:
+            payload["timing"] = trace.as_ms()
+        return server.sse_event("done", payload)
+
+    async def generate():
+        yield server.sse_event("sources", {"sources": plan.get("sources", [])})
+        if "prompt" not in plan:
+            yield server.sse_event("token", {"text": plan["answer"]})
+            yield done_event({"answer": plan["answer"], "cached": bool(plan.get("cached"))})
+            return
+
+        parts = []
+        t0 = time.perf_counter()
+        tokens = astream_openai_chat(plan["prompt"], model=server.OPENAI_MODEL, timeout=server.OLLAMA_TIMEOUT)
+        try:
+            async for delta in tokens:
+                if not parts:
+                    ttft = time.perf_counter() - t0
+                    metrics.observe("llm_first_token", ttft)
+                    trace.add("llm_first_token", ttft)
+                parts.append(delta)
+                yield server.sse_event("token", {"text": delta})
+        except (GeneratorExit, asyncio.CancelledError):
+            logger.info("Client disconnected mid-stream after %d chunks", len(parts))
+            raise
+        except Exception as e:
+            logger.exception("Error while streaming answer")
+            yield server.sse_event("error", {"error": str(e)})
+            return
+        finally:
+            await tokens.aclose()
+
+        elapsed = time.perf_counter() - t0
+        metrics.observe("llm_stream", elapsed)
+        trace.add("llm_stream", elapsed)
+        answer = "".join(parts).strip()
+        await run_blocking(server.record_answer, plan, answer)
+        yield done_event({"answer": answer, "cached": False})
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(generate(), media_type="text/event-stream", headers=headers)
+
+async def api_kb_reload(request: Request):
+    # Reloads this worker only; with several workers use KB_RELOAD_INTERVAL.
+    if not server.admin_authorized(request.headers.get("authorization", "")):
+        return JSONResponse({"error": "Forbidden"}, status_code=403)
+    data = await read_json(request)
+    kb_name = server.kb_param(data, request.query_params)
+    try:
+        return JSONResponse(await run_blocking(server.reload_kb, bool(data.get("force")), kb_name))
+    except UnknownKB as e:
+        return JSONResponse(server.unknown_kb_error(e), status_code=404)
+    except (ValueError, FileNotFoundError) as e:
+        logger.warning("KB reload rejected: %s", e)
+        return JSONResponse({"error": str(e), "kb_version": server.get_tenant(kb_name).kb.version},
+                            status_code=422)
+
+async def api_query_batch(request: Request):
+    parsed = server.parse_batch_request(await read_json(request), request.query_params)
+    if isinstance(parsed, str):
+        return JSONResponse({"error": parsed}, status_code=400)
+    questions, top_k, concurrency, want_timing, kb_name = parsed
+
+    with trace_request() as trace:
+        try:
+            results, jobs = await run_blocking(server.plan_batch, questions, top_k, kb_name)
+        except UnknownKB as e:
+            return JSONResponse(server.unknown_kb_error(e), status_code=404)
+        except Exception as e:
+            logger.exception("Unhandled error")
+            return JSONResponse({"error": str(e)}, status_code=500)
+
+        # per-batch limit on top of the process-wide LLM_MAX_CONCURRENCY
+        slots = asyncio.Semaphore(concurrency)
+
+        async def run(plan, indices):
+            async with slots:
+                try:
+                    answer = (await acall_openai_chat(plan["prompt"], model=server.OPENAI_MODEL,
+                                                      timeout=server.OLLAMA_TIMEOUT)).strip()
+                    await run_blocking(server.record_answer, plan, answer)
+                    outcome = {"answer": answer, "sources": plan["sources"]}
+                except Exception as e:
+                    logger.warning("Batch question failed: %s", e)
+                    outcome = {"error": str(e)}
+            for i in indices:
+                results[i].update(outcome)
+
+        await asyncio.gather(*(run(plan, indices) for plan, indices in jobs))
+        result = {"results": results}
+        if want_timing:
+            result["timing"] = trace.as_ms()
+        return JSONResponse(result)
+
+class RequestCounter:
+    # ASGI middleware counting responses by route and status for /metrics.
+    def __init__(self, app, paths=()):
+        self.app = app
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope["path"] if scope["path"] in self.paths else "unmatched"
+            metrics.REQUESTS.inc(route=route, status=status["code"])
+
+routes = [
+    Route("/", home, methods=["GET"]),
+    Route("/favicon.ico", favicon),
+    Route("/healthz", healthz, methods=["GET"]),
+    Route("/readyz", readyz, methods=["GET"]),
+    Route("/metrics", prometheus_metrics, methods=["GET"]),
+    Route("/api/cache", api_cache_stats, methods=["GET"]),
+    Route("/api/query", api_query, methods=["GET", "POST"]),
+    Route("/api/query/stream", api_query_stream, methods=["POST"]),
+    Route("/api/query/batch", api_query_batch, methods=["POST"]),
+    Route("/api/kb/reload", api_kb_reload, methods=["POST"]),
+]
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(RequestCounter, paths=[r.path for r in routes]),
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]),
+    ],
+)
+
+def main():
+    import uvicorn
+
+    host = os.environ.get("FLASK_HOST", "0.0.0.0")
+    port = int(os.environ.get("PORT", os.environ.get("FLASK_PORT", 8080)))
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+    uvicorn.run("asgi:app", host=host, port=port, workers=workers,
+                timeout_keep_alive=30, log_level="info")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# batch_query.py
+# Answers a file of questions in bulk: used to pre-warm the answer caches after
+# a KB rebuild and to run regression question sets.
+#
+# Questions come from a text file (one per line) or JSONL ({"question": ...}).
+# By default they are answered in-process, which warms a shared
+# ANSWER_CACHE_PATH; with --url they are posted to a running server's
+# /api/query/batch, which warms that server's own caches.
+#
+#   python batch_query.py questions.txt --out answers.jsonl
+#   python batch_query.py questions.jsonl --url http://localhost:8080 --concurrency 16
+import argparse
+import json
+import sys
+import time
+import urllib.request
+
+
+def read_questions(path: str):
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if path.endswith(".jsonl"):
+                line = json.loads(line).get("question", "")
+            questions.append(line)
+    return questions
+
+
+def post_batch(url: str, questions, top_k: int, concurrency: int, timeout: float, kb: str = None):
+    payload = {"questions": questions, "top_k": top_k, "concurrency": concurrency}
+    if kb:
+        payload["kb"] = kb
+    body = json.dumps(payload).encode("utf-8")
+    req = urllib.request.Request(url.rstrip("/") + "/api/query/batch", data=body,
+                                 headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return json.loads(resp.read())["results"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a file of questions via the batch query pipeline.")
+    parser.add_argument("questions", help="text file (one question per line) or JSONL with a 'question' field")
+    parser.add_argument("--url", help="post to a running server instead of answering in-process")
+    parser.add_argument("--out", help="write JSONL results here (default: stdout)")
+    parser.add_argument("--kb", help="knowledge base name (default: the server's DEFAULT_KB)")
+    parser.add_argument("--top-k", type=int, default=None)
+    parser.add_argument("--concurrency", type=int, default=None, help="concurrent LLM calls per batch")
+    parser.add_argument("--chunk", type=int, default=100, help="questions per batch request")
+    parser.add_argument("--timeout", type=float, default=600.0, help="per-batch HTTP timeout (--url)")
+    args = parser.parse_args()
+
+    questions = read_questions(args.questions)
+    if args.url:
+        top_k = args.top_k or 5
+        concurrency = args.concurrency or 8
+        answer = lambda chunk: post_batch(args.url, chunk, top_k, concurrency, args.timeout, args.kb)
+    else:
+        import server
+        top_k = args.top_k or server.TOP_K
+        concurrency = args.concurrency or server.BATCH_LLM_CONCURRENCY
+        answer = lambda chunk: server.answer_batch(chunk, top_k, concurrency, args.kb)
+
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    errors = cached = 0
+    t0 = time.perf_counter()
+    try:
+        for start in range(0, len(questions), args.chunk):
+            for result in answer(questions[start:start + args.chunk]):
+                errors += "error" in result
+                cached += bool(result.get("cached"))
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            print(f"{min(start + args.chunk, len(questions))}/{len(questions)} questions",
+                  file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - t0
+    print(f"{len(questions)} questions in {elapsed:.1f}s ({cached} cached, {errors} errors)", file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
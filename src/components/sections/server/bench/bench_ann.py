@@ -0,0 +1,74 @@
+# bench/bench_ann.py
+# Exact scan vs. IVF index on a synthetic clustered KB: build time, per-query
+# latency and recall@k against exact search for several nprobe values.
+#
+#   python bench/bench_ann.py [--items 200000] [--dim 384] [--nlist 0] [--k 5]
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from ranking import RankingModel, normalize_rows  # noqa: E402
+from vector_index import ExactIndex, IVFIndex, build_ivf, recall_at_k  # noqa: E402
+
+
+def clustered(n: int, dim: int, topics: int, noise: float, rng):
+    centers = normalize_rows(rng.standard_normal((topics, dim), dtype=np.float32))
+    labels = rng.integers(0, topics, size=n)
+    x = centers[labels] + noise * rng.standard_normal((n, dim), dtype=np.float32)
+    return normalize_rows(x)
+
+
+def per_query_ms(index, queries, k):
+    t0 = time.perf_counter()
+    for q in queries:
+        index.search(q, k)
+    return (time.perf_counter() - t0) / len(queries) * 1e3
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--items", type=int, default=200_000)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--topics", type=int, default=2_000)
+    ap.add_argument("--noise", type=float, default=0.05)
+    ap.add_argument("--nlist", type=int, default=0, help="default: sqrt(items)")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=5)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    text = clustered(args.items, args.dim, args.topics, args.noise, rng)
+    title = normalize_rows(text + args.noise * rng.standard_normal(text.shape, dtype=np.float32))
+    items = [{"id": str(i)} for i in range(args.items)]
+    ranking = RankingModel.from_embeddings(items, text, title, alpha_text=0.8, beta_title=1.0,
+                                           gamma_priority=0.0, id_boosts={}, recency_base_year=0,
+                                           recency_scale=0.0)
+    del text, title
+    picks = rng.choice(args.items, size=args.queries, replace=False)
+    queries = normalize_rows(ranking.matrix[picks, :args.dim]
+                             + 0.5 * args.noise * rng.standard_normal((args.queries, args.dim), dtype=np.float32))
+
+    nlist = args.nlist or max(1, int(np.sqrt(args.items)))
+    t0 = time.perf_counter()
+    centroids, offsets, rows = build_ivf(ranking.matrix, nlist)
+    print(f"{args.items} items, dim {args.dim}, {nlist} lists, IVF build {time.perf_counter() - t0:.1f}s")
+
+    exact = ExactIndex(ranking)
+    exact_ms = per_query_ms(exact, queries, args.k)
+    print(f"{'index':>12} {'ms/query':>9} {'speedup':>8} {'recall@' + str(args.k):>9}")
+    print(f"{'exact':>12} {exact_ms:>9.3f} {1.0:>7.1f}x {1.0:>9.3f}")
+    for nprobe in (1, 4, 8, 16, 32):
+        if nprobe > nlist:
+            break
+        ivf = IVFIndex(ranking, centroids, offsets, rows, nprobe=nprobe, always_include=0)
+        ms = per_query_ms(ivf, queries, args.k)
+        rec = recall_at_k(exact, ivf, queries, args.k)
+        print(f"{'ivf/' + str(nprobe):>12} {ms:>9.3f} {exact_ms / ms:>7.1f}x {rec:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# bench/bench_embed_batching.py
+# Query-embedding throughput: one encode() per query (current per-request path)
+# vs. MicroBatcher coalescing, at several client concurrencies.
+#
+#   python bench/bench_embed_batching.py [--concurrency 1 4 16 64] [--queries 512]
+import argparse
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from embed_batcher import MicroBatcher  # noqa: E402
+
+MODEL_NAME = "sentence-transformers/paraphrase-MiniLM-L3-v2"
+
+
+def run_clients(fn, queries, concurrency: int) -> float:
+    it = iter(queries)
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                q = next(it, None)
+            if q is None:
+                return
+            fn(q)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return len(queries) / (time.perf_counter() - t0)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", default=MODEL_NAME)
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    ap.add_argument("--queries", type=int, default=512)
+    ap.add_argument("--max-batch-size", type=int, default=32)
+    ap.add_argument("--max-wait-ms", type=float, default=2.0)
+    args = ap.parse_args()
+
+    os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(args.model, device="cpu")
+
+    def encode_one(q):
+        return model.encode(q, convert_to_numpy=True, normalize_embeddings=True)
+
+    def encode_many(qs):
+        return model.encode(list(qs), convert_to_numpy=True, normalize_embeddings=True, batch_size=len(qs))
+
+    batcher = MicroBatcher(encode_many, args.max_batch_size, args.max_wait_ms)
+    queries = [f"What did Omar work on in project number {i} and which tools were used?" for i in range(args.queries)]
+    encode_one(queries[0])  # warm up
+
+    print(f"{'conc':>5} {'single q/s':>11} {'batched q/s':>12} {'speedup':>8} {'mean batch':>11}")
+    for conc in args.concurrency:
+        single = run_clients(encode_one, queries, conc)
+        batcher.batches = batcher.items = 0
+        batched = run_clients(batcher.encode, queries, conc)
+        print(f"{conc:>5} {single:>11.1f} {batched:>12.1f} {batched / single:>7.2f}x "
+              f"{batcher.stats()['mean_batch_size']:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# bench/bench_quantized.py
+# float32 vs. int8 / float16 vector storage on a synthetic clustered KB:
+# resident bytes of the scored matrix, per-query latency and recall@k against
+# float32 exact search, with and without float32 re-ranking.
+#
+#   python bench/bench_quantized.py [--items 100000] [--rerank 50]
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from bench_ann import clustered  # noqa: E402
+from kb_store import VECTORS_FILE, load_quantized, write_quantized  # noqa: E402
+from ranking import QuantizedRankingModel, RankingModel, normalize_rows  # noqa: E402
+from vector_index import ExactIndex, recall_at_k  # noqa: E402
+
+WEIGHTS = dict(alpha_text=0.8, beta_title=1.0, gamma_priority=0.0, id_boosts={},
+               recency_base_year=0, recency_scale=0.0)
+
+
+def per_query_ms(model, queries, k):
+    t0 = time.perf_counter()
+    for q in queries:
+        model.top_k(q, k)
+    return (time.perf_counter() - t0) / len(queries) * 1e3
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--items", type=int, default=100_000)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--topics", type=int, default=2_000)
+    ap.add_argument("--noise", type=float, default=0.05)
+    ap.add_argument("--queries", type=int, default=100)
+    ap.add_argument("--rerank", type=int, default=50)
+    ap.add_argument("--k", type=int, default=5)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    text = clustered(args.items, args.dim, args.topics, args.noise, rng)
+    title = normalize_rows(text + args.noise * rng.standard_normal(text.shape, dtype=np.float32))
+    items = [{"id": str(i)} for i in range(args.items)]
+    queries = normalize_rows(text[rng.choice(args.items, size=args.queries, replace=False)]
+                             + args.noise * rng.standard_normal((args.queries, args.dim), dtype=np.float32))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        np.save(Path(tmp) / VECTORS_FILE, np.hstack([text, title]))
+        del text, title
+        vectors = np.load(Path(tmp) / VECTORS_FILE, mmap_mode="r")
+        exact = ExactIndex(RankingModel(items, np.asarray(vectors), **WEIGHTS))
+
+        print(f"{'storage':>16} {'MiB':>8} {'ms/query':>9} {'recall@' + str(args.k):>9}")
+        print(f"{'float32':>16} {vectors.nbytes / 2**20:>8.1f} "
+              f"{per_query_ms(exact.ranking, queries, args.k):>9.3f} {1.0:>9.3f}")
+        for kind in ("float16", "int8"):
+            write_quantized(tmp, kind, "bench")
+            qvectors, scales = load_quantized(tmp, kind, "bench")
+            nbytes = qvectors.nbytes + (scales.nbytes if scales is not None else 0)
+            for rerank in (0, args.rerank):
+                model = QuantizedRankingModel(items, vectors, qvectors, scales, rerank=rerank, **WEIGHTS)
+                label = f"{kind}" + (f"+rerank{rerank}" if rerank else "")
+                print(f"{label:>16} {nbytes / 2**20:>8.1f} {per_query_ms(model, queries, args.k):>9.3f} "
+                      f"{recall_at_k(exact, ExactIndex(model), queries, args.k):>9.3f}")
+            del qvectors, scales, model
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# bench/bench_ranking.py
+# Microbenchmark: legacy per-request scoring loop vs. the precomputed RankingModel
+# on synthetic knowledge bases.
+#
+#   python bench/bench_ranking.py [--sizes 1000 10000 100000] [--dim 384] [--queries 50]
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from ranking import RankingModel, extract_most_recent_year, normalize_rows  # noqa: E402
+
+ALPHA_TEXT = 0.8
+BETA_TITLE = 1.0
+GAMMA_PRIORITY = 1.2
+RECENCY_BASE_YEAR = 2018
+RECENCY_SCALE = 0.05
+ID_BOOSTS = {"humly": 1.5, "outliar": 1.3, "meliox": 0.5, "skills": 2.0, "education": 1.5, "contact": 1.5, "languages": 1.5}
+
+
+def synthetic_kb(n: int, dim: int, rng):
+    items = []
+    boost_ids = list(ID_BOOSTS)
+    for i in range(n):
+        item_id = boost_ids[i] if i < len(boost_ids) else f"item_{i}"
+        # half the items have no "year", forcing the legacy path to run the regex
+        year = int(rng.integers(2015, 2026)) if i % 2 == 0 else None
+        items.append({
+            "id": item_id,
+            "title": f"Item {i}",
+            "text": f"Synthetic entry {i} worked there from {2015 + i % 10} to present.",
+            "priority": float(rng.random()) if i % 5 == 0 else 0.0,
+            "year": year,
+        })
+    text = normalize_rows(rng.standard_normal((n, dim), dtype=np.float32))
+    title = normalize_rows(rng.standard_normal((n, dim), dtype=np.float32))
+    return items, text, title
+
+
+def legacy_top_k(q, k, kb_items, kb_embeddings, title_embeddings):
+    sim_text = np.dot(kb_embeddings, q)
+    sim_title = np.dot(title_embeddings, q)
+    combined = ALPHA_TEXT * sim_text + BETA_TITLE * sim_title
+    for idx, it in enumerate(kb_items):
+        priority = float(it.get("priority", 0.0) or 0.0)
+        combined[idx] += GAMMA_PRIORITY * priority
+        item_id = it.get("id")
+        if item_id in ID_BOOSTS:
+            combined[idx] += float(ID_BOOSTS[item_id])
+        year = it.get("year") or extract_most_recent_year(it.get("text", ""))
+        if year:
+            combined[idx] += max(0, int(year) - RECENCY_BASE_YEAR) * RECENCY_SCALE
+    idxs = np.argsort(-combined)[:k]
+    return idxs, combined[idxs]
+
+
+def timed(fn, queries):
+    t0 = time.perf_counter()
+    out = [fn(q) for q in queries]
+    return (time.perf_counter() - t0) / len(queries), out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--queries", type=int, default=50)
+    ap.add_argument("--k", type=int, default=5)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'items':>8} {'legacy ms':>10} {'model ms':>10} {'speedup':>8} {'build ms':>9}  same top-k")
+    for n in args.sizes:
+        items, text, title = synthetic_kb(n, args.dim, rng)
+        queries = normalize_rows(rng.standard_normal((args.queries, args.dim), dtype=np.float32))
+
+        t0 = time.perf_counter()
+        model = RankingModel.from_embeddings(items, text, title,
+                                             alpha_text=ALPHA_TEXT, beta_title=BETA_TITLE,
+                                             gamma_priority=GAMMA_PRIORITY, id_boosts=ID_BOOSTS,
+                                             recency_base_year=RECENCY_BASE_YEAR,
+                                             recency_scale=RECENCY_SCALE)
+        build = time.perf_counter() - t0
+
+        legacy_s, legacy_out = timed(lambda q: legacy_top_k(q, args.k, items, text, title), queries)
+        model_s, model_out = timed(lambda q: model.top_k(q, args.k), queries)
+        same = all(set(a[0].tolist()) == set(b[0].tolist()) for a, b in zip(legacy_out, model_out))
+        print(f"{n:>8} {legacy_s * 1e3:>10.3f} {model_s * 1e3:>10.3f} {legacy_s / model_s:>7.1f}x {build * 1e3:>9.1f}  {same}")
+
+
+if __name__ == "__main__":
+    main()
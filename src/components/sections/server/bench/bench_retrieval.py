@@ -0,0 +1,207 @@
+# bench/bench_retrieval.py
+# Offline retrieval benchmark; no LLM or network calls.
+#
+# eval:  runs the labeled question -> expected-ids set (bench/retrieval_eval.jsonl)
+#        through the server's retrieval path (embedder, ranking weights, index,
+#        BM25 fusion and the lexical prefilter as configured by the environment)
+#        and reports recall@k, MRR and per-query encode/search latency. --set
+#        re-scores the same queries with changed ranking weights next to the
+#        current ones, so a weight change can be judged before it ships.
+# scale: synthetic KBs of several sizes; scoring latency per query, batched
+#        scoring throughput, and embedder encode throughput per batch size.
+#
+# Run from the directory that contains kb_store/ (i.e. after embed.py). The
+# embedder must already be in the local Hugging Face cache; set
+# HF_HUB_OFFLINE=1 to guarantee no downloads.
+#   python bench/bench_retrieval.py eval --k 5 --set alpha_text=1.0 --set id_boosts='{}'
+#   python bench/bench_retrieval.py eval --min-recall 0.8 --min-mrr 0.6 --max-p95-ms 50
+#   python bench/bench_retrieval.py scale --sizes 1000 10000 100000
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+from ranking import RankingModel, normalize_rows  # noqa: E402
+from knowledge_base import KnowledgeBase  # noqa: E402
+from vector_index import ExactIndex  # noqa: E402
+
+
+def load_server():
+    # The eval measures the server's own configuration, so import it rather than
+    # copying its weights. No LLM call is made.
+    os.environ.setdefault("LLM_BACKEND", "stub")
+    os.environ.setdefault("EMBEDDER_WARMUP", "0")
+    os.environ.setdefault("EMBED_BATCH_MAX_SIZE", "1")
+    import server
+    return server
+
+
+def load_labels(path: Path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def parse_override(text: str):
+    name, _, value = text.partition("=")
+    return name.strip(), json.loads(value)
+
+
+def percentile(values, p: float) -> float:
+    return float(np.percentile(values, p)) if len(values) else 0.0
+
+
+def score_run(server, kb, ids, labels, k: int):
+    recalls, rr, latencies, misses = [], [], [], []
+    for label in labels:
+        t0 = time.perf_counter()
+        _, idxs = server.retrieve(kb, label["question"], k)
+        latencies.append((time.perf_counter() - t0) * 1e3)
+        got = [ids[i] for i in idxs]
+        expected = set(label["expected"])
+        recalls.append(len(expected.intersection(got)) / len(expected))
+        rank = next((r for r, item_id in enumerate(got, 1) if item_id in expected), None)
+        rr.append(1.0 / rank if rank else 0.0)
+        if rank is None:
+            misses.append((label["question"], got))
+    return {
+        "recall": float(np.mean(recalls)),
+        "mrr": float(np.mean(rr)),
+        "search_p50_ms": percentile(latencies, 50),
+        "search_p95_ms": percentile(latencies, 95),
+        "search_ms": latencies,
+        "misses": misses,
+    }
+
+
+def run_eval(args) -> int:
+    server = load_server()
+    labels = load_labels(Path(args.labels))
+    kb = server.get_tenant(args.kb).kb
+    ids = [it.get("id") for it in kb.items]
+    unknown = sorted({i for label in labels for i in label["expected"]} - set(ids))
+    if unknown:
+        print("warning: expected ids not in the KB:", ", ".join(unknown))
+
+    questions = [label["question"] for label in labels]
+    encode_ms = []
+    for question in questions:
+        t0 = time.perf_counter()
+        server.encode_queries([question])
+        encode_ms.append((time.perf_counter() - t0) * 1e3)
+    server.get_query_embeddings(questions)  # cached, so search timings exclude encoding
+
+    runs = [("current", kb)]
+    if args.set:
+        weights = dict(server.ranking_weights)
+        weights.update(parse_override(text) for text in args.set)
+        candidate = RankingModel(kb.items, kb.store.vectors, **weights)
+        runs.append(("candidate", KnowledgeBase(kb.store, candidate, ExactIndex(candidate), kb.lexical)))
+
+    print(f"{len(labels)} labeled questions, {len(ids)} items, k={args.k}, "
+          f"index {kb.index.kind}{'+bm25' if kb.lexical is not None else ''}, encode p50 {percentile(encode_ms, 50):.2f} ms "
+          f"p95 {percentile(encode_ms, 95):.2f} ms")
+    print(f"{'run':>10} {'recall@k':>9} {'MRR':>7} {'search p50':>11} {'search p95':>11}")
+    results = {}
+    for name, run_kb in runs:
+        r = score_run(server, run_kb, ids, labels, args.k)
+        results[name] = r
+        print(f"{name:>10} {r['recall']:>9.3f} {r['mrr']:>7.3f} "
+              f"{r['search_p50_ms']:>9.3f}ms {r['search_p95_ms']:>9.3f}ms")
+        if args.verbose:
+            for question, got in r["misses"]:
+                print(f"{'':>10} miss: {question!r} -> {got}")
+
+    # gate on the last run: the candidate when --set is given
+    gated = results[runs[-1][0]]
+    p95 = percentile([e + s for e, s in zip(encode_ms, gated["search_ms"])], 95)
+    failures = []
+    if gated["recall"] < args.min_recall:
+        failures.append(f"recall@{args.k} {gated['recall']:.3f} < {args.min_recall}")
+    if gated["mrr"] < args.min_mrr:
+        failures.append(f"MRR {gated['mrr']:.3f} < {args.min_mrr}")
+    if args.max_p95_ms and p95 > args.max_p95_ms:
+        failures.append(f"encode+search p95 {p95:.2f} ms > {args.max_p95_ms} ms")
+    for failure in failures:
+        print("FAIL:", failure)
+    return 1 if failures else 0
+
+
+def run_scale(args) -> int:
+    rng = np.random.default_rng(0)
+    print(f"{'items':>8} {'score ms/q':>11} {'batched q/s':>12} {'MB':>7}")
+    for n in args.sizes:
+        text = normalize_rows(rng.standard_normal((n, args.dim), dtype=np.float32))
+        title = normalize_rows(rng.standard_normal((n, args.dim), dtype=np.float32))
+        items = [{"id": str(i), "priority": float(i % 3) / 10} for i in range(n)]
+        model = RankingModel.from_embeddings(items, text, title, alpha_text=0.8, beta_title=1.0,
+                                             gamma_priority=1.2, id_boosts={}, recency_base_year=2018,
+                                             recency_scale=0.05)
+        del text, title
+        queries = normalize_rows(rng.standard_normal((args.queries, args.dim), dtype=np.float32))
+        t0 = time.perf_counter()
+        for q in queries:
+            model.top_k(q, args.k)
+        single = (time.perf_counter() - t0) / len(queries) * 1e3
+        t0 = time.perf_counter()
+        model.top_k_many(queries, args.k)
+        batched = len(queries) / (time.perf_counter() - t0)
+        print(f"{n:>8} {single:>11.3f} {batched:>12.0f} {model.matrix.nbytes / 2**20:>7.1f}")
+
+    if args.no_encode:
+        return 0
+    try:
+        server = load_server()
+        server.get_embedder()
+    except Exception as e:
+        print("encode: skipped, embedder unavailable offline:", e)
+        return 0
+    sentences = [f"What did Omar work on in project number {i}?" for i in range(max(args.encode_batches))]
+    server.encode_queries(sentences[:1])
+    print(f"{'batch':>8} {'encode ms':>11} {'sentences/s':>12}")
+    for b in args.encode_batches:
+        reps = max(1, args.encode_sentences // b)
+        t0 = time.perf_counter()
+        for _ in range(reps):
+            server.encode_queries(sentences[:b])
+        elapsed = time.perf_counter() - t0
+        print(f"{b:>8} {elapsed / reps * 1e3:>11.2f} {reps * b / elapsed:>12.0f}")
+    return 0
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline retrieval quality and speed benchmark.")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    ev = sub.add_parser("eval", help="recall@k / MRR / latency on the labeled question set")
+    ev.add_argument("--labels", default=str(BENCH_DIR / "retrieval_eval.jsonl"))
+    ev.add_argument("--k", type=int, default=5)
+    ev.add_argument("--kb", help="knowledge base name (default: DEFAULT_KB)")
+    ev.add_argument("--set", action="append", default=[], metavar="WEIGHT=JSON",
+                    help="ranking weight override for a candidate run, e.g. alpha_text=1.0 or "
+                         "id_boosts='{\"humly\": 2}' (repeatable)")
+    ev.add_argument("--min-recall", type=float, default=0.0)
+    ev.add_argument("--min-mrr", type=float, default=0.0)
+    ev.add_argument("--max-p95-ms", type=float, default=0.0, help="encode + search p95 budget (0 = off)")
+    ev.add_argument("--verbose", action="store_true", help="list questions with no expected id in the top k")
+
+    sc = sub.add_parser("scale", help="synthetic KB scoring and encode throughput")
+    sc.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    sc.add_argument("--dim", type=int, default=384)
+    sc.add_argument("--queries", type=int, default=200)
+    sc.add_argument("--k", type=int, default=5)
+    sc.add_argument("--encode-batches", type=int, nargs="+", default=[1, 8, 32])
+    sc.add_argument("--encode-sentences", type=int, default=256, help="sentences encoded per batch size")
+    sc.add_argument("--no-encode", action="store_true")
+
+    args = ap.parse_args()
+    return run_eval(args) if args.command == "eval" else run_scale(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+# bench/load_test.py
+# Concurrency load test: starts the stub LLM (bench/stub_llm.py), starts the
+# backend in WSGI (gunicorn gthread, as in start.sh) and/or ASGI (uvicorn
+# asgi:app) mode pointed at the stub, and drives /api/query at several
+# concurrency levels.
+#
+# Run from the directory that contains kb_store/ (i.e. after embed.py):
+#   python bench/load_test.py --mode both --concurrency 8 64 256 --llm-delay 1.0
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+SERVER_DIR = BENCH_DIR.parent
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port: int, proc, timeout: float = 120.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"process exited early with code {proc.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"port {port} did not open within {timeout}s")
+
+
+def start(cmd, env, cwd):
+    return subprocess.Popen(cmd, env=env, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def server_command(mode: str, port: int, workers: int, threads: int):
+    if mode == "wsgi":
+        return [sys.executable, "-m", "gunicorn", "server:app", "--bind", f"127.0.0.1:{port}",
+                "--workers", str(workers), "--threads", str(threads), "--timeout", "120",
+                "--worker-class", "gthread"]
+    return [sys.executable, "-m", "uvicorn", "asgi:app", "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning"]
+
+
+async def post_query(port: int, question: str):
+    body = json.dumps({"question": question}).encode("utf-8")
+    t0 = time.perf_counter()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(
+        b"POST /api/query HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n"
+        b"Connection: close\r\nContent-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+    )
+    await writer.drain()
+    raw = await reader.read()
+    writer.close()
+    status = int(raw.split(b" ", 2)[1]) if raw else 0
+    return status, time.perf_counter() - t0
+
+
+async def drive(port: int, concurrency: int, total: int):
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with sem:
+            try:
+                return await post_query(port, f"Which project used technology number {i}?")
+            except OSError:
+                return 0, 0.0
+
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(total)))
+    wall = time.perf_counter() - t0
+    lat = sorted(t for s, t in results if s == 200)
+    errors = sum(1 for s, _ in results if s != 200)
+    return wall, lat, errors
+
+
+def pct(values, p):
+    if not values:
+        return float("nan")
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mode", choices=["wsgi", "asgi", "both"], default="both")
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[8, 64, 256])
+    ap.add_argument("--requests-per-level", type=int, default=None,
+                    help="defaults to 2x the concurrency level")
+    ap.add_argument("--llm-delay", type=float, default=1.0)
+    ap.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", 1)))
+    ap.add_argument("--threads", type=int, default=int(os.environ.get("GUNICORN_THREADS", 2)))
+    args = ap.parse_args()
+
+    modes = ["wsgi", "asgi"] if args.mode == "both" else [args.mode]
+    stub_port = free_port()
+    env = dict(os.environ)
+    env["STUB_LLM_DELAY"] = str(args.llm_delay)
+    stub = start([sys.executable, "-m", "uvicorn", "stub_llm:app", "--port", str(stub_port),
+                  "--log-level", "warning"], env, BENCH_DIR)
+    try:
+        wait_for_port(stub_port, stub)
+        env.update({
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{stub_port}/v1",
+            "OPENAI_API_KEY": "stub",
+            "ANSWER_CACHE_MAX_ENTRIES": "0",
+            "PYTHONPATH": os.pathsep.join(filter(None, [str(SERVER_DIR), env.get("PYTHONPATH")])),
+        })
+        print(f"stub LLM delay {args.llm_delay:.2f}s, workers={args.workers}, gthread threads={args.threads}")
+        print(f"{'mode':>5} {'conc':>5} {'reqs':>5} {'err':>4} {'req/s':>8} {'p50 s':>7} {'p95 s':>7} {'max s':>7}")
+        for mode in modes:
+            port = free_port()
+            proc = start(server_command(mode, port, args.workers, args.threads), env, os.getcwd())
+            try:
+                wait_for_port(port, proc)
+                asyncio.run(drive(port, 1, 2))  # warm up the embedder
+                for conc in args.concurrency:
+                    total = args.requests_per_level or 2 * conc
+                    wall, lat, errors = asyncio.run(drive(port, conc, total))
+                    print(f"{mode:>5} {conc:>5} {total:>5} {errors:>4} {len(lat) / wall:>8.1f} "
+                          f"{statistics.median(lat) if lat else float('nan'):>7.2f} "
+                          f"{pct(lat, 95):>7.2f} {lat[-1] if lat else float('nan'):>7.2f}")
+            finally:
+                proc.terminate()
+                proc.wait(timeout=30)
+    finally:
+        stub.terminate()
+        stub.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# bench/stub_llm.py
+# Minimal OpenAI-compatible chat completions server for load tests. Each call
+# sleeps STUB_LLM_DELAY seconds (simulating upstream generation time) and then
+# answers with a canned text, streamed word by word when stream=true.
+# STUB_LLM_ERROR_RATE fails that fraction of calls with 429 (Retry-After: 0) or
+# 503, and STUB_LLM_SLOW_RATE makes that fraction take STUB_LLM_SLOW_DELAY
+# seconds, to exercise the gateway's retries and hedging.
+#
+#   uvicorn stub_llm:app --port 9999
+#   OPENAI_BASE_URL=http://127.0.0.1:9999/v1 OPENAI_API_KEY=stub python ../asgi.py
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+STUB_LLM_DELAY = float(os.environ.get("STUB_LLM_DELAY", 1.0))
+STUB_LLM_ANSWER = os.environ.get("STUB_LLM_ANSWER", "This is a stubbed answer from the load-test LLM.")
+STUB_LLM_ERROR_RATE = float(os.environ.get("STUB_LLM_ERROR_RATE", 0))
+STUB_LLM_SLOW_RATE = float(os.environ.get("STUB_LLM_SLOW_RATE", 0))
+STUB_LLM_SLOW_DELAY = float(os.environ.get("STUB_LLM_SLOW_DELAY", 10.0))
+
+
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "stub")
+    cid = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+
+    if random.random() < STUB_LLM_ERROR_RATE:
+        if random.random() < 0.5:
+            return JSONResponse({"error": {"message": "stub rate limit", "type": "rate_limit"}},
+                                status_code=429, headers={"Retry-After": "0"})
+        return JSONResponse({"error": {"message": "stub overloaded", "type": "server_error"}}, status_code=503)
+    delay = STUB_LLM_SLOW_DELAY if random.random() < STUB_LLM_SLOW_RATE else STUB_LLM_DELAY
+
+    if not body.get("stream"):
+        await asyncio.sleep(delay)
+        return JSONResponse({
+            "id": cid, "object": "chat.completion", "created": created, "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": STUB_LLM_ANSWER}}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        })
+
+    words = STUB_LLM_ANSWER.split(" ")
+
+    async def generate():
+        for i, word in enumerate(words):
+            await asyncio.sleep(delay / len(words))
+            chunk = {
+                "id": cid, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": None,
+                             "delta": {"content": word if i == 0 else " " + word}}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        final = {"id": cid, "object": "chat.completion.chunk", "created": created, "model": model,
+                 "choices": [{"index": 0, "finish_reason": "stop", "delta": {}}]}
+        yield f"data: {json.dumps(final)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(generate(), media_type="text/event-stream")
+
+
+app = Starlette(routes=[Route("/v1/chat/completions", chat_completions, methods=["POST"])])
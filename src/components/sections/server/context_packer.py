@@ -0,0 +1,98 @@
+# context_packer.py
+# Fits retrieved KB items into the prompt's CONTEXT_TOKEN_BUDGET without cutting
+# any item mid-sentence.
+import re
+import unicodedata
+
+# Token counting uses tiktoken when it is installed; otherwise a regex
+# approximation (words and punctuation, long words split every 4 chars) that
+# tracks BPE counts for English prose closely enough to budget a prompt.
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+SEPARATOR = "\n---\n"
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return sum(1 + (len(t) - 1) // 4 for t in _TOKEN_RE.findall(text))
+
+
+def split_sentences(text: str):
+    return [s for s in _SENTENCE_RE.split(text.strip()) if s]
+
+
+def _norm(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return " ".join(_TOKEN_RE.findall(text))
+
+
+def dedupe_summary(summary: str, text: str) -> str:
+    # Keep only summary sentences the full text doesn't already contain; the
+    # summary is usually the first sentence of the text, repeated.
+    if not summary or not text:
+        return summary
+    body = _norm(text)
+    kept = [s for s in split_sentences(summary) if _norm(s) not in body]
+    return " ".join(kept)
+
+
+def render_item(it: dict) -> str:
+    title = it.get('title', '')
+    summary = dedupe_summary(it.get('summary', ''), it.get('text', ''))
+    text = it.get('text', '')
+
+    part = f"## {title}\n"
+    if summary:
+        part += f"**Summary:** {summary}\n\n"
+    if text:
+        part += f"{text}\n"
+    return part
+
+
+def _trim_to_budget(part: str, budget: int) -> str:
+    # Only used when even the best item alone exceeds the budget: keep whole
+    # sentences from its start rather than sending no context at all.
+    out = ""
+    for sentence in split_sentences(part):
+        candidate = f"{out} {sentence}" if out else sentence
+        if count_tokens(candidate) > budget:
+            break
+        out = candidate
+    return out
+
+
+def pack_context(items, token_budget: int) -> dict:
+    # items are in score order. Greedily take each whole item that still fits
+    # and skip the ones that don't, so a long low-ranked item never crowds out
+    # a short one and nothing is cut mid-sentence.
+    sep_tokens = count_tokens(SEPARATOR)
+    parts, ids, dropped = [], [], []
+    used = 0
+    for it in items:
+        part = render_item(it)
+        cost = count_tokens(part) + (sep_tokens if parts else 0)
+        if used + cost > token_budget:
+            dropped.append(it.get("id"))
+            continue
+        parts.append(part)
+        ids.append(it.get("id"))
+        used += cost
+
+    if not parts and items:
+        part = _trim_to_budget(render_item(items[0]), token_budget)
+        if part:
+            parts.append(part)
+            ids.append(items[0].get("id"))
+            dropped = dropped[1:]
+            used = count_tokens(part)
+
+    return {"context": SEPARATOR.join(parts), "ids": ids, "dropped": dropped, "tokens": used}
@@ -1,10 +1,17 @@
 # embed.py
+import argparse
+import hashlib
 import json
+import os
 import re
+import textwrap
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from pathlib import Path
 
+from kb_store import (ITEMS_FILE, LEGACY_EMB_FILE, META_FILE, STORE_FORMAT, VECTORS_FILE,
+                      write_npy_from_raw, write_quantized)
+from lexical import BM25Builder
+
 # ------------- Customize: your KB -------------
 knowledge_base = [
     {
@@ -222,6 +229,7 @@ knowledge_base = [
 MODEL_NAME = "sentence-transformers/paraphrase-MiniLM-L3-v2"  # small, fast and good
 OUT_DIR = Path("kb_store")
 OUT_DIR.mkdir(exist_ok=True)
+BATCH_SIZE = 256  # items embedded (and written) per step
 
 # per-id default priority overrides
 DEFAULT_PRIORITIES = {
@@ -269,30 +277,164 @@ def extract_most_recent_year(text: str):
     years_int = [int(y) for y in years]
     return max(years_int)
 
+# ------------- Sources -------------
+# Items stream from the sources one at a time, so memory does not grow with the
+# corpus. Without --source the built-in knowledge_base above is used.
+def slugify(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-") or "section"
+
+def iter_jsonl(path: Path):
+    with open(path, "r", encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            item.setdefault("id", f"{path.stem}-{lineno}")
+            item.setdefault("title", path.stem)
+            yield item
+
+def iter_json(path: Path):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    for n, item in enumerate(data if isinstance(data, list) else [data], 1):
+        item.setdefault("id", f"{path.stem}-{n}")
+        item.setdefault("title", path.stem)
+        yield item
+
+def iter_markdown(path: Path, root: Path):
+    # One item per heading section; text before the first heading belongs to
+    # a section titled after the file.
+    rel = path.relative_to(root).as_posix() if root != path else path.name
+    title, lines, used = path.stem, [], set()
+
+    def section():
+        text = " ".join(" ".join(lines).split())
+        if not text:
+            return None
+        slug = base = slugify(title)
+        n = 2
+        while slug in used:
+            slug, n = f"{base}-{n}", n + 1
+        used.add(slug)
+        return {"id": f"{rel}#{slug}", "title": title, "text": text, "source": rel}
+
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            m = re.match(r"^#{1,6}\s+(.*\S)\s*$", line)
+            if m:
+                item = section()
+                if item:
+                    yield item
+                title, lines = m.group(1), []
+            else:
+                lines.append(line.strip())
+    item = section()
+    if item:
+        yield item
+
+def iter_text(path: Path, root: Path):
+    rel = path.relative_to(root).as_posix() if root != path else path.name
+    text = " ".join(path.read_text(encoding="utf-8").split())
+    if text:
+        yield {"id": rel, "title": path.stem, "text": text, "source": rel}
+
+def iter_path(path: Path, root: Path):
+    suffix = path.suffix.lower()
+    if suffix == ".jsonl":
+        yield from iter_jsonl(path)
+    elif suffix == ".json":
+        yield from iter_json(path)
+    elif suffix in (".md", ".markdown"):
+        yield from iter_markdown(path, root)
+    elif suffix == ".txt":
+        yield from iter_text(path, root)
+
+def iter_sources(sources):
+    if not sources:
+        yield from knowledge_base
+        return
+    for src in sources:
+        src = Path(src)
+        if src.is_dir():
+            for path in sorted(p for p in src.rglob("*") if p.is_file()):
+                yield from iter_path(path, src)
+        elif src.is_file():
+            yield from iter_path(src, src)
+        else:
+            raise FileNotFoundError(f"KB source not found: {src}")
+
 # ------------- Build enhanced KB -------------
-kb_enhanced = []
-for item in knowledge_base:
+def enhance(item):
     new_item = dict(item)  # shallow copy
     text = new_item.get("text", "")
     title = new_item.get("title", "")
     new_item["summary"] = make_summary(text)
     new_item["tags"] = make_tags(title)
     new_item["year"] = extract_most_recent_year(text)
-    # default priority
-    new_item["priority"] = float(DEFAULT_PRIORITIES.get(new_item.get("id"), 0.0))
-    kb_enhanced.append(new_item)
+    # default priority (sources may set their own)
+    new_item["priority"] = float(new_item.get("priority", DEFAULT_PRIORITIES.get(new_item.get("id"), 0.0)) or 0.0)
+    return new_item
 
-# ------------- Load model & embed -------------
-print("Loading model:", MODEL_NAME)
-model = SentenceTransformer(MODEL_NAME)
+def iter_enhanced(sources):
+    seen = set()
+    for item in iter_sources(sources):
+        if not item.get("text"):
+            continue
+        item["id"] = str(item["id"])
+        if item["id"] in seen:
+            raise ValueError(f"Duplicate KB id: {item['id']}")
+        seen.add(item["id"])
+        yield enhance(item)
+
+def batched(iterable, n: int):
+    batch = []
+    for x in iterable:
+        batch.append(x)
+        if len(batch) >= n:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# ------------- Incremental build -------------
+def title_text(item) -> str:
+    return (item.get("title","") + " " + " ".join(item.get("tags",[]))).strip()
 
-texts = [item["text"] for item in kb_enhanced]
-title_texts = [ (item.get("title","") + " " + " ".join(item.get("tags",[]))).strip() for item in kb_enhanced ]
+def content_hash(item, model_name: str) -> str:
+    # Everything that feeds the two embeddings of an item, plus the model.
+    h = hashlib.sha256()
+    for part in (model_name, item.get("text", ""), title_text(item)):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
 
-print("Embedding", len(texts), "text items...")
-text_embeddings = model.encode(texts, show_progress_bar=True, convert_to_numpy=True, normalize_embeddings=True)
-print("Embedding", len(title_texts), "title items...")
-title_embeddings = model.encode(title_texts, show_progress_bar=True, convert_to_numpy=True, normalize_embeddings=True)
+class PreviousBuild:
+    # Vectors of a previous build, looked up by id and content hash. The
+    # previous kb_vectors.npy is memory-mapped, so reuse costs no extra memory.
+    def __init__(self, out_dir: Path, model_name: str):
+        self.rows = {}
+        meta_path, vec_path = out_dir / META_FILE, out_dir / VECTORS_FILE
+        if not meta_path.exists() or not vec_path.exists():
+            return
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("format") != STORE_FORMAT or meta.get("model") != model_name:
+                return
+            self.vectors = np.load(vec_path, mmap_mode="r")
+            self.dim = self.vectors.shape[1] // 2
+            self.rows = {i: (h, n) for n, (i, h) in enumerate(zip(meta["ids"], meta["hashes"]))}
+        except Exception as e:
+            print("Ignoring unreadable previous build:", e)
+            self.rows = {}
+
+    def lookup(self, item_id: str, h: str):
+        row = self.rows.get(item_id)
+        if row is None or row[0] != h:
+            return None
+        vec = np.array(self.vectors[row[1]])
+        return vec[:self.dim], vec[self.dim:]
 
 # Make sure embeddings are float32 and normalized
 def normalize_rows(x):
@@ -300,16 +442,200 @@ def normalize_rows(x):
     norms = np.linalg.norm(x, axis=1, keepdims=True) + 1e-12
     return x / norms
 
-text_embeddings = normalize_rows(text_embeddings)
-title_embeddings = normalize_rows(title_embeddings)
+class StoreWriter:
+    # Appends items and vectors batch by batch to temporary files and only
+    # assembles (and atomically swaps in) the final kb_store files at the end.
+    # Layout: see kb_store.py.
+    def __init__(self, out_dir: Path):
+        self.out_dir = out_dir
+        self.items_tmp = out_dir / (ITEMS_FILE + ".tmp")
+        self.vectors_raw = out_dir / (VECTORS_FILE + ".raw.tmp")
+        self.items_f = open(self.items_tmp, "w", encoding="utf-8")
+        self.vectors_f = open(self.vectors_raw, "wb")
+        self.ids = []
+        self.hashes = []
+        self.dim = None
+        self._version = hashlib.sha256()
+        self.bm25 = BM25Builder(out_dir)
+
+    def add(self, items, hashes, text_vecs, title_vecs):
+        vecs = np.hstack([normalize_rows(text_vecs), normalize_rows(title_vecs)])
+        if self.dim is None:
+            self.dim = text_vecs.shape[1]
+        for item in items:
+            chunk = textwrap.indent(json.dumps(item, ensure_ascii=False, indent=2), "  ")
+            self.items_f.write("[\n" if not self.ids else ",\n")
+            self.items_f.write(chunk)
+            self._version.update(chunk.encode("utf-8"))
+            self.ids.append(item["id"])
+        for h in hashes:
+            self._version.update(h.encode("ascii"))
+        self.hashes.extend(hashes)
+        self.bm25.add(items)
+        self.vectors_f.write(np.ascontiguousarray(vecs, dtype=np.float32).tobytes())
+
+    def close(self, model_name: str, derived=()):
+        # derived: fn(version, vectors_path) callbacks that build files from the
+        # new vectors (IVF index, quantized copies) before kb_meta.json is replaced
+        self.items_f.write("\n]" if self.ids else "[]")
+        self.items_f.close()
+        self.vectors_f.close()
+        n, dim = len(self.ids), self.dim or 0
+        self._version.update(model_name.encode("utf-8"))
+        self.version = self._version.hexdigest()[:16]
+
+        vectors_tmp = self.out_dir / (VECTORS_FILE + ".tmp")
+        write_npy_from_raw(self.vectors_raw, vectors_tmp, n, 2 * dim)
+        os.remove(self.vectors_raw)
+        # The BM25 index is tagged with the new version and written before
+        # kb_meta.json, so a reloading server finds it complete.
+        terms, postings = self.bm25.write(self.out_dir, self.version)
+        print(f"BM25 index: {terms} terms, {postings} postings")
+        for derive in derived:
+            derive(self.version, vectors_tmp)
+        meta_tmp = self.out_dir / (META_FILE + ".tmp")
+        with open(meta_tmp, "w", encoding="utf-8") as f:
+            json.dump({"format": STORE_FORMAT, "model": model_name, "dim": dim, "count": n,
+                       "version": self.version,
+                       "ids": self.ids, "hashes": self.hashes}, f, ensure_ascii=False)
+
+        # Replace the old store; a previous build's kb_vectors.npy may still be
+        # mapped by a running server, which keeps its own (unlinked) copy.
+        os.replace(vectors_tmp, self.out_dir / VECTORS_FILE)
+        os.replace(self.items_tmp, self.out_dir / ITEMS_FILE)
+        os.replace(meta_tmp, self.out_dir / META_FILE)
+        legacy = self.out_dir / LEGACY_EMB_FILE
+        if legacy.exists():
+            os.remove(legacy)
+
+# ------------- Load model & embed -------------
+_model = None
+
+def get_model():
+    global _model
+    if _model is None:
+        from sentence_transformers import SentenceTransformer
+        print("Loading model:", MODEL_NAME)
+        _model = SentenceTransformer(MODEL_NAME)
+    return _model
+
+def build(sources, full: bool = False, batch_size: int = BATCH_SIZE, derived=()):
+    previous = PreviousBuild(OUT_DIR, MODEL_NAME) if not full else None
+    writer = StoreWriter(OUT_DIR)
+    reused = embedded = 0
+    for batch in batched(iter_enhanced(sources), batch_size):
+        hashes = [content_hash(item, MODEL_NAME) for item in batch]
+        text_vecs = [None] * len(batch)
+        title_vecs = [None] * len(batch)
+        stale = []
+        for i, (item, h) in enumerate(zip(batch, hashes)):
+            hit = previous.lookup(item["id"], h) if previous else None
+            if hit is None:
+                stale.append(i)
+            else:
+                text_vecs[i], title_vecs[i] = hit
+        if stale:
+            model = get_model()
+            new_text = model.encode([batch[i]["text"] for i in stale],
+                                    convert_to_numpy=True, normalize_embeddings=True)
+            new_title = model.encode([title_text(batch[i]) for i in stale],
+                                     convert_to_numpy=True, normalize_embeddings=True)
+            for j, i in enumerate(stale):
+                text_vecs[i], title_vecs[i] = new_text[j], new_title[j]
+        writer.add(batch, hashes, np.stack(text_vecs), np.stack(title_vecs))
+        reused += len(batch) - len(stale)
+        embedded += len(stale)
+        print(f"  {len(writer.ids)} items processed ({embedded} embedded, {reused} reused)")
+    removed = len(set(previous.rows) - set(writer.ids)) if previous else 0
+    writer.close(MODEL_NAME, derived)
+    print(f"{len(writer.ids)} items: {reused} unchanged, {embedded} embedded, {removed} removed")
+    return writer.version
+
+# ------------- ANN index -------------
+def build_index(version: str, vectors_path: Path, nlist: int, recall_queries: int = 200, k: int = 5):
+    from ranking import RankingModel
+    from vector_index import ExactIndex, IVFIndex, build_ivf, recall_at_k, save_ivf
+
+    vectors = np.load(vectors_path, mmap_mode="r")
+    n = vectors.shape[0]
+    if not nlist:
+        nlist = max(1, int(np.sqrt(n)))
+    print(f"Building IVF index: {n} vectors, {nlist} lists")
+    centroids, offsets, rows = build_ivf(vectors, nlist)
+    save_ivf(OUT_DIR, version, centroids, offsets, rows)
+
+    # recall@k of the IVF candidates vs. exact search (similarity only, no bias),
+    # using the title vectors of random items as queries
+    items = [{"id": str(i)} for i in range(n)]
+    ranking = RankingModel(items, vectors, alpha_text=0.8, beta_title=1.0, gamma_priority=0.0,
+                           id_boosts={}, recency_base_year=0, recency_scale=0.0)
+    rng = np.random.default_rng(0)
+    dim = vectors.shape[1] // 2
+    sample = np.sort(rng.choice(n, size=min(n, recall_queries), replace=False))
+    queries = normalize_rows(np.asarray(vectors[sample])[:, dim:])
+    exact = ExactIndex(ranking)
+    for nprobe in (1, 4, 8, 16):
+        if nprobe > nlist:
+            break
+        ivf = IVFIndex(ranking, centroids, offsets, rows, nprobe=nprobe, always_include=0)
+        print(f"  nprobe={nprobe:<3} recall@{k}={recall_at_k(exact, ivf, queries, k):.3f}")
+
+# ------------- ONNX query encoder -------------
+def export_encoder(out_dir: Path, int8: bool, tolerance: float = None, sentences: int = 256):
+    # Exports the embedder for EMBEDDER_BACKEND=onnx and checks it against the
+    # PyTorch model on KB texts. onnx_meta.json is only written if every
+    # sentence's cosine to the reference is within `tolerance` of 1.
+    from onnx_encoder import OnnxEncoder, export_onnx, parity, write_onnx_meta
+
+    if tolerance is None:
+        tolerance = 0.02 if int8 else 1e-4
+    model = get_model()
+    print("Exporting ONNX encoder to", out_dir, "(int8)" if int8 else "")
+    meta = export_onnx(model, MODEL_NAME, out_dir, int8=int8)
+    with open(OUT_DIR / ITEMS_FILE, "r", encoding="utf-8") as f:
+        items = json.load(f)
+    texts = [t for it in items for t in (it.get("text", ""), title_text(it)) if t][:sentences]
+    reference = model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+    exported = OnnxEncoder(out_dir, meta=meta).encode(texts, normalize_embeddings=True)
+    result = parity(np.asarray(reference, dtype=np.float32), exported)
+    print(f"  parity over {result['sentences']} sentences: min cosine {result['min_cosine']:.6f}, "
+          f"mean {result['mean_cosine']:.6f}, max abs diff {result['max_abs_diff']:.2e}")
+    if 1.0 - result["min_cosine"] > tolerance:
+        raise SystemExit(f"ONNX export differs from {MODEL_NAME} by more than {tolerance}; "
+                         "onnx_meta.json not written")
+    write_onnx_meta(out_dir, dict(meta, parity=dict(result, tolerance=tolerance)))
 
-# Save metadata and embeddings
-ids = [item["id"] for item in kb_enhanced]
-with open(OUT_DIR / "kb_items.json", "w", encoding="utf-8") as f:
-    json.dump(kb_enhanced, f, ensure_ascii=False, indent=2)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build kb_store from the knowledge base.")
+    parser.add_argument("--source", action="append", default=[],
+                        help="JSONL/JSON/Markdown/text file or directory to index (repeatable); "
+                             "defaults to the built-in knowledge_base")
+    parser.add_argument("--full", action="store_true", help="re-embed every item instead of reusing unchanged vectors")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--index", choices=["exact", "ivf"], default="exact",
+                        help="also build an IVF (approximate nearest neighbour) index; serve it with INDEX_KIND=ivf")
+    parser.add_argument("--nlist", type=int, default=0, help="IVF lists (default: sqrt(n))")
+    parser.add_argument("--quantize", action="append", choices=["int8", "float16"], default=[],
+                        help="also write a quantized copy of the vectors; serve it with EMBED_QUANTIZATION")
+    parser.add_argument("--export-onnx", nargs="?", const="onnx_model", default=None, metavar="DIR",
+                        help="also export the query encoder to ONNX (default dir: onnx_model); "
+                             "serve it with EMBEDDER_BACKEND=onnx")
+    parser.add_argument("--onnx-int8", action="store_true", help="int8-quantize the exported encoder")
+    parser.add_argument("--onnx-tolerance", type=float, default=None,
+                        help="max 1 - cosine vs. the PyTorch model (default 1e-4, 0.02 with --onnx-int8)")
+    args = parser.parse_args()
 
-np.savez_compressed(OUT_DIR / "kb_embeddings.npz",
-                    embeddings=text_embeddings,
-                    title_embeddings=title_embeddings,
-                    ids=np.array(ids, dtype=object))
-print("Saved enhanced KB and embeddings to", OUT_DIR)
+    # The IVF index and quantized copies are built from the new vectors before
+    # kb_meta.json is replaced, so a reloading server sees them complete.
+    derived = []
+    if args.index == "ivf":
+        derived.append(lambda version, vectors_path: build_index(version, vectors_path, args.nlist))
+    for kind in args.quantize:
+        def quantize(version, vectors_path, kind=kind):
+            print("Writing", kind, "vectors")
+            write_quantized(OUT_DIR, kind, version, vectors_path)
+        derived.append(quantize)
+    version = build(args.source, full=args.full, batch_size=args.batch_size, derived=derived)
+    if args.export_onnx:
+        export_encoder(Path(args.export_onnx), args.onnx_int8, args.onnx_tolerance)
+    print("Saved enhanced KB and embeddings to", OUT_DIR)
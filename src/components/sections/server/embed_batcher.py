@@ -0,0 +1,87 @@
+# embed_batcher.py
+# Coalesces concurrent single-query encode calls into one batched encode.
+# Callers block on submit(); a background thread collects queued texts for up to
+# max_wait_ms (or until max_batch_size is reached), encodes them in one call and
+# hands each caller its row.
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    def __init__(self, encode_fn: Callable[[Sequence[str]], np.ndarray],
+                 max_batch_size: int = 32, max_wait_ms: float = 2.0):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+
+    def _ensure_started(self):
+        # Started lazily so that forked workers (gunicorn) each get their own thread.
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        fut = Future()
+        self._ensure_started()
+        self._queue.put((text, fut))
+        return fut
+
+    def encode(self, text: str) -> np.ndarray:
+        return self.submit(text).result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # identical texts in one window are encoded once
+            unique = list(dict.fromkeys(text for text, _ in batch))
+            try:
+                vecs = np.asarray(self.encode_fn(unique), dtype=np.float32)
+                rows = {text: vecs[i].copy() for i, text in enumerate(unique)}
+                for text, fut in batch:
+                    fut.set_result(rows[text])
+            except Exception as e:
+                logger.exception("Batched encode failed for %d queries", len(unique))
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+            self.batches += 1
+            self.items += len(batch)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": (self.items / self.batches) if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+        }
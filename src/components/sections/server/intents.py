@@ -0,0 +1,79 @@
+# intents.py
+# Intent routing for incoming questions. Each intent's patterns are compiled
+# into one alternation and searched separately, so intents whose patterns
+# overlap (e.g. a canned "job openings" and the "work" flag) can't hide each
+# other; the result lists every intent that matched.
+#
+# Intents with an answer are "canned": the first matching one (in registration
+# order) answers the question without touching the embedder or the LLM.
+# Intents without an answer are flags (e.g. "work") that tune retrieval.
+import json
+import logging
+import re
+from pathlib import Path
+from typing import NamedTuple, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+class IntentResult(NamedTuple):
+    intent: Optional[str]     # first matching canned intent
+    answer: Optional[str]     # its answer
+    matched: frozenset        # every intent that matched (canned or flag)
+
+    def has(self, name: str) -> bool:
+        return name in self.matched
+
+
+class IntentRouter:
+    def __init__(self):
+        self._intents = []      # (name, patterns, answer, exact phrases)
+        self._regexes = []      # (name, compiled alternation of its patterns)
+        self._exact = {}
+
+    def register(self, name: str, patterns: Sequence[str] = (), answer: Optional[str] = None,
+                 exact: Sequence[str] = ()):
+        # `exact` phrases match only when they are the whole (lowercased) question.
+        self._intents = [i for i in self._intents if i[0] != name]
+        self._intents.append((name, list(patterns), answer, [e.lower().strip() for e in exact]))
+        self._compile()
+
+    def _compile(self):
+        self._regexes, self._exact = [], {}
+        for name, patterns, _, exact in self._intents:
+            for pat in patterns:
+                re.compile(pat)  # fail early with the offending pattern
+            if patterns:
+                self._regexes.append((name, re.compile("|".join(f"(?:{pat})" for pat in patterns))))
+            for phrase in exact:
+                self._exact.setdefault(phrase, name)
+
+    def load(self, path):
+        # JSON list of {"name", "patterns", "answer", "exact"} objects.
+        with open(path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+        for entry in entries:
+            self.register(entry["name"], entry.get("patterns", []), entry.get("answer"),
+                          entry.get("exact", []))
+        logger.info("Loaded %d intents from %s", len(entries), path)
+
+    def route(self, text: str) -> IntentResult:
+        t = (text or "").lower().strip()
+        matched = set()
+        if t in self._exact:
+            matched.add(self._exact[t])
+        if t:
+            matched.update(name for name, regex in self._regexes if regex.search(t))
+        for name, _, answer, _ in self._intents:
+            if answer is not None and name in matched:
+                return IntentResult(name, answer, frozenset(matched))
+        return IntentResult(None, None, frozenset(matched))
+
+
+def load_router(defaults: Sequence[dict], path: Optional[str] = None) -> IntentRouter:
+    router = IntentRouter()
+    for entry in defaults:
+        router.register(**entry)
+    if path and Path(path).exists():
+        router.load(path)
+    return router
@@ -0,0 +1,119 @@
+# kb_registry.py
+# Several named kb_store directories served by one process. A Tenant is one
+# named KB: its active KnowledgeBase (swapped on reload) plus the answer caches
+# tied to it. Tenants are opened on first use; at most max_resident stay loaded
+# and the least recently used one is dropped first. Pinned tenants (the default
+# KB) are never dropped. Requests still holding a dropped tenant finish with it.
+#
+# Names come from an explicit {name: dir} map and, optionally, from a root
+# directory whose subdirectories are KBs named after them; new subdirectories
+# there are picked up without a restart.
+import logging
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from kb_store import LEGACY_EMB_FILE, META_FILE
+
+logger = logging.getLogger(__name__)
+
+KB_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+
+class UnknownKB(KeyError):
+    pass
+
+
+class Tenant:
+    def __init__(self, name: str, kb_dir: Path, kb, answer_cache, semantic_cache):
+        self.name = name
+        self.kb_dir = kb_dir
+        self.kb = kb  # replaced as a whole on reload; read it once per request
+        self.answer_cache = answer_cache
+        self.semantic_cache = semantic_cache
+        self.reload_lock = threading.Lock()
+
+
+def parse_kb_dirs(text: str) -> dict:
+    # "docs=/srv/kb/docs,faq=/srv/kb/faq" -> {"docs": Path(...), "faq": Path(...)}
+    dirs = {}
+    for entry in filter(None, (part.strip() for part in text.split(","))):
+        name, sep, path = entry.partition("=")
+        name = name.strip()
+        if not sep or not KB_NAME_RE.match(name) or not path.strip():
+            raise ValueError(f"Bad KB_DIRS entry {entry!r}; expected name=path")
+        dirs[name] = Path(path.strip())
+    return dirs
+
+
+class KBRegistry:
+    def __init__(self, dirs: dict, open_tenant, root=None, max_resident: int = 8, pinned=()):
+        # open_tenant(name, kb_dir) -> Tenant; may raise for unservable stores
+        self.dirs = dict(dirs)
+        self.root = Path(root) if root else None
+        self.open_tenant = open_tenant
+        self.max_resident = max(1, int(max_resident))
+        self.pinned = set(pinned)
+        self._resident = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    def path_for(self, name: str) -> Path:
+        if name in self.dirs:
+            return self.dirs[name]
+        if self.root is not None and KB_NAME_RE.match(name or ""):
+            path = self.root / name
+            if (path / META_FILE).exists() or (path / LEGACY_EMB_FILE).exists():
+                return path
+        raise UnknownKB(name)
+
+    def names(self) -> list:
+        names = set(self.dirs)
+        if self.root is not None and self.root.is_dir():
+            names.update(p.name for p in self.root.iterdir()
+                         if KB_NAME_RE.match(p.name) and ((p / META_FILE).exists() or (p / LEGACY_EMB_FILE).exists()))
+        return sorted(names)
+
+    def get(self, name: str) -> Tenant:
+        # Raises UnknownKB for names that map to no store.
+        with self._lock:
+            tenant = self._resident.get(name)
+            if tenant is not None:
+                self._resident.move_to_end(name)
+                return tenant
+            kb_dir = self.path_for(name)
+            loading = self._loading.setdefault(name, threading.Lock())
+        # one load per name at a time; other names keep being served meanwhile
+        with loading:
+            with self._lock:
+                tenant = self._resident.get(name)
+                if tenant is not None:
+                    self._resident.move_to_end(name)
+                    return tenant
+            tenant = self.open_tenant(name, kb_dir)
+            with self._lock:
+                self._resident[name] = tenant
+                self.loads += 1
+                self._evict()
+        return tenant
+
+    def _evict(self):
+        for name in list(self._resident):
+            if len(self._resident) <= self.max_resident:
+                return
+            if name not in self.pinned:
+                del self._resident[name]
+                self.evictions += 1
+                logger.info("KB %r unloaded (least recently used, %d resident)", name, len(self._resident))
+
+    def resident(self) -> list:
+        with self._lock:
+            return list(self._resident.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"resident": len(self._resident), "max_resident": self.max_resident,
+                    "loads": self.loads, "evictions": self.evictions}
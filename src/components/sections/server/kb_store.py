@@ -0,0 +1,191 @@
+# kb_store.py
+# On-disk layout of kb_store/ as written by embed.py:
+#   kb_items.json   item metadata (id, title, text, summary, tags, year, priority)
+#   kb_meta.json    ids, content hashes, model name, dim and a build version
+#   kb_vectors.npy  float32 (n, 2 * dim) = [text | title] embeddings, L2-normalized
+# kb_vectors.npy is uncompressed and already normalized, so it is opened with
+# mmap_mode="r" and used as is: worker processes share its pages through the OS
+# page cache instead of each holding a private copy.
+import json
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ITEMS_FILE = "kb_items.json"
+META_FILE = "kb_meta.json"
+VECTORS_FILE = "kb_vectors.npy"
+LEGACY_EMB_FILE = "kb_embeddings.npz"
+STORE_FORMAT = 2
+
+# Optional quantized copies of kb_vectors.npy (embed.py --quantize ...)
+QUANT_META_FILE = "kb_quant.json"
+QUANT_FILES = {
+    "int8": ("kb_vectors_int8.npy", "kb_vectors_int8_scale.npy"),
+    "float16": ("kb_vectors_f16.npy", None),
+}
+
+
+class KBStore:
+    def __init__(self, path: Path, items, ids, vectors: np.ndarray, model: str, version: str):
+        self.path = path
+        self.items = items
+        self.ids = ids
+        self.vectors = vectors
+        self.model = model
+        self.version = version
+        self.dim = vectors.shape[1] // 2
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def text_embeddings(self) -> np.ndarray:
+        return self.vectors[:, :self.dim]
+
+    @property
+    def title_embeddings(self) -> np.ndarray:
+        return self.vectors[:, self.dim:]
+
+
+def load_store(kb_dir) -> KBStore:
+    kb_dir = Path(kb_dir)
+    items_path = kb_dir / ITEMS_FILE
+    if (kb_dir / META_FILE).exists() and (kb_dir / VECTORS_FILE).exists():
+        store = _load_mmap(kb_dir)
+    elif (kb_dir / LEGACY_EMB_FILE).exists() and items_path.exists():
+        store = _load_legacy(kb_dir)
+    else:
+        raise FileNotFoundError(f"No KB found in {kb_dir}. Run embed.py first.")
+
+    if len(store.items) != len(store.ids) or store.vectors.shape[0] != len(store.ids):
+        raise ValueError(
+            f"KB in {kb_dir} is inconsistent: {len(store.items)} items, {len(store.ids)} ids, "
+            f"{store.vectors.shape[0]} vectors. Re-run embed.py."
+        )
+    mismatched = [i for i, (it, id_) in enumerate(zip(store.items, store.ids)) if it.get("id") != id_]
+    if mismatched:
+        raise ValueError(f"KB in {kb_dir}: item/vector ids differ at row {mismatched[0]}. Re-run embed.py.")
+    return store
+
+
+def stored_version(kb_dir):
+    # Build version of the store currently on disk, read from kb_meta.json only
+    # (embed.py replaces it last). None for missing or legacy stores.
+    try:
+        with open(Path(kb_dir) / META_FILE, "r", encoding="utf-8") as f:
+            return json.load(f).get("version")
+    except (OSError, ValueError):
+        return None
+
+
+def _load_mmap(kb_dir: Path) -> KBStore:
+    with open(kb_dir / META_FILE, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("format") != STORE_FORMAT:
+        raise ValueError(f"Unsupported kb_store format {meta.get('format')!r} in {kb_dir}")
+    with open(kb_dir / ITEMS_FILE, "r", encoding="utf-8") as f:
+        items = json.load(f)
+    vectors = np.load(kb_dir / VECTORS_FILE, mmap_mode="r")
+    if vectors.dtype != np.float32 or vectors.ndim != 2:
+        raise ValueError(f"{VECTORS_FILE} must be a 2-D float32 array, got {vectors.dtype} {vectors.shape}")
+    return KBStore(kb_dir, items, list(meta["ids"]), vectors, meta.get("model", ""), meta["version"])
+
+
+def _load_legacy(kb_dir: Path) -> KBStore:
+    # kb_embeddings.npz from older embed.py runs: compressed, pickled ids and
+    # not guaranteed normalized, so this path decompresses into private memory.
+    from answer_cache import file_fingerprint
+    from ranking import normalize_rows
+
+    logger.warning("Loading legacy %s; re-run embed.py for the memory-mapped store", LEGACY_EMB_FILE)
+    with open(kb_dir / ITEMS_FILE, "r", encoding="utf-8") as f:
+        items = json.load(f)
+    npz = np.load(kb_dir / LEGACY_EMB_FILE, allow_pickle=True)
+    vectors = np.hstack([normalize_rows(npz["embeddings"]), normalize_rows(npz["title_embeddings"])])
+    vectors.flags.writeable = False
+    model = str(npz["model"]) if "model" in npz.files else ""
+    version = file_fingerprint(kb_dir / ITEMS_FILE, kb_dir / LEGACY_EMB_FILE)
+    return KBStore(kb_dir, items, [str(i) for i in npz["ids"]], vectors, model, version)
+
+
+def write_npy_from_raw(raw_path: Path, out_path: Path, rows: int, cols: int, dtype=np.float32):
+    # Wrap a file of raw C-order rows in an .npy header without loading it.
+    header = {"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)), "fortran_order": False,
+              "shape": (rows, cols)}
+    with open(out_path, "wb") as out, open(raw_path, "rb") as raw:
+        np.lib.format.write_array_header_1_0(out, header)
+        for chunk in iter(lambda: raw.read(1 << 22), b""):
+            out.write(chunk)
+
+
+def read_quant_meta(kb_dir: Path) -> dict:
+    meta_path = kb_dir / QUANT_META_FILE
+    if not meta_path.exists():
+        return {}
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_quant_meta(kb_dir: Path, meta: dict):
+    tmp = kb_dir / (QUANT_META_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, kb_dir / QUANT_META_FILE)
+
+
+def write_quantized(kb_dir, kind: str, store_version: str, vectors_path=None, chunk: int = 65536):
+    # Streams kb_vectors.npy (or vectors_path, e.g. a build's not yet swapped
+    # in copy) into a quantized copy. int8 uses one symmetric scale per row
+    # half (text, title), i.e. x ~= q * scale.
+    # A running server may have the previous copy memory-mapped, so the new one
+    # is written to temp files and os.replace'd; the kind is dropped from
+    # kb_quant.json meanwhile so no loader pairs old metadata with new files.
+    kb_dir = Path(kb_dir)
+    vec_name, scale_name = QUANT_FILES[kind]
+    vectors = np.load(vectors_path or kb_dir / VECTORS_FILE, mmap_mode="r")
+    n, cols = vectors.shape
+    dim = cols // 2
+    dtype = np.int8 if kind == "int8" else np.float16
+    out = np.lib.format.open_memmap(kb_dir / (vec_name + ".tmp"), mode="w+", dtype=dtype, shape=(n, cols))
+    scales = (np.lib.format.open_memmap(kb_dir / (scale_name + ".tmp"), mode="w+", dtype=np.float32,
+                                        shape=(n, 2))
+              if scale_name else None)
+    for start in range(0, n, chunk):
+        block = np.asarray(vectors[start:start + chunk], dtype=np.float32)
+        if kind == "float16":
+            out[start:start + len(block)] = block.astype(np.float16)
+            continue
+        halves = block.reshape(len(block), 2, dim)
+        sc = np.abs(halves).max(axis=2) / 127.0 + 1e-12
+        q = np.clip(np.rint(halves / sc[:, :, None]), -127, 127).astype(np.int8)
+        out[start:start + len(block)] = q.reshape(len(block), cols)
+        scales[start:start + len(block)] = sc
+    out.flush()
+    del out
+    if scales is not None:
+        scales.flush()
+        del scales
+
+    meta = read_quant_meta(kb_dir)
+    if meta.pop(kind, None) is not None:
+        write_quant_meta(kb_dir, meta)
+    os.replace(kb_dir / (vec_name + ".tmp"), kb_dir / vec_name)
+    if scale_name:
+        os.replace(kb_dir / (scale_name + ".tmp"), kb_dir / scale_name)
+    meta[kind] = store_version
+    write_quant_meta(kb_dir, meta)
+
+
+def load_quantized(kb_dir, kind: str, store_version: str):
+    # (qvectors, scales) memory-mapped, or None if missing or stale.
+    kb_dir = Path(kb_dir)
+    if kind not in QUANT_FILES or read_quant_meta(kb_dir).get(kind) != store_version:
+        return None
+    vec_name, scale_name = QUANT_FILES[kind]
+    qvectors = np.load(kb_dir / vec_name, mmap_mode="r")
+    scales = np.load(kb_dir / scale_name, mmap_mode="r") if scale_name else None
+    return qvectors, scales
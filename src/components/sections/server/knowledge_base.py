@@ -0,0 +1,73 @@
+# knowledge_base.py
+# A loaded kb_store version together with everything derived from it (ranking
+# model, retrieval index, BM25 index, id lookup). Requests take one reference
+# and use it throughout, so swapping in a new version never mixes versions;
+# the old version's memory maps stay valid until its last request finishes.
+import logging
+
+import numpy as np
+
+from kb_store import load_quantized, load_store
+from lexical import load_bm25
+from ranking import QuantizedRankingModel, RankingModel
+from vector_index import load_index
+
+logger = logging.getLogger(__name__)
+
+
+class KnowledgeBase:
+    def __init__(self, store, ranking: RankingModel, index, lexical=None):
+        self.store = store
+        self.items = store.items
+        self.version = store.version
+        self.ranking = ranking
+        self.index = index
+        self.lexical = lexical
+        self.item_index = {it.get("id"): i for i, it in enumerate(store.items)}
+
+    def __len__(self):
+        return len(self.items)
+
+
+def open_kb(kb_dir, ranking_weights: dict, quantization: str = "none", rerank: int = 50,
+            index_kind: str = "exact", nprobe: int = 8, lexical: bool = True) -> KnowledgeBase:
+    store = load_store(kb_dir)
+    # Priority, ID boosts and recency are static per item: fold them into the
+    # ranking model once at load time.
+    if quantization != "none" and (index_kind or "").lower() == "ivf":
+        # IVFIndex scores its candidates with the float32 rows
+        logger.warning("%s quantization is not used with the IVF index; using float32", quantization)
+        quantization = "none"
+    quantized = load_quantized(kb_dir, quantization, store.version) if quantization != "none" else None
+    if quantized is not None:
+        ranking = QuantizedRankingModel(store.items, store.vectors, *quantized,
+                                        rerank=rerank, **ranking_weights)
+    else:
+        if quantization != "none":
+            logger.warning("No up-to-date %s vectors in %s; using float32", quantization, kb_dir)
+        ranking = RankingModel(store.items, store.vectors, **ranking_weights)
+    index = load_index(index_kind, ranking, kb_dir, store.version, nprobe=nprobe)
+    bm25 = load_bm25(kb_dir, store.version) if lexical else None
+    return KnowledgeBase(store, ranking, index, bm25)
+
+
+def validate_kb(kb: KnowledgeBase, current: KnowledgeBase = None):
+    # Raises ValueError if kb can't replace current. load_store has already
+    # checked that items, ids and vector rows line up.
+    if not kb.items:
+        raise ValueError("KB is empty")
+    if len(kb.item_index) != len(kb.items):
+        raise ValueError("KB has duplicate item ids")
+    if kb.lexical is not None and len(kb.lexical) != len(kb.items):
+        raise ValueError(f"BM25 index covers {len(kb.lexical)} items, KB has {len(kb.items)}")
+    if current is not None:
+        if kb.store.dim != current.store.dim:
+            raise ValueError(f"embedding dim changed from {current.store.dim} to {kb.store.dim}; "
+                             "restart to switch embedders")
+        if kb.store.model and current.store.model and kb.store.model != current.store.model:
+            raise ValueError(f"KB was embedded with {kb.store.model}, serving {current.store.model}; "
+                             "restart to switch embedders")
+    probe = np.full(kb.store.dim, 1.0 / np.sqrt(kb.store.dim), dtype=np.float32)
+    idxs, scores = kb.index.search(probe, 1)
+    if len(idxs) != 1 or not np.all(np.isfinite(scores)):
+        raise ValueError("KB vectors produce no finite scores")
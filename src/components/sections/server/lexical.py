@@ -0,0 +1,245 @@
+# lexical.py
+# BM25 over item titles, tags and text, stored as an inverted index: a sorted
+# vocabulary plus CSR-style postings (row ids and field-weighted term
+# frequencies per term, term i's postings at [offsets[i], offsets[i + 1])).
+# Written by embed.py next to the dense vectors and fused with dense retrieval
+# in server.py by reciprocal-rank fusion.
+#
+#   kb_bm25.json          store version, BM25 parameters, vocabulary
+#   kb_bm25_offsets.npy   int64 (V + 1,)
+#   kb_bm25_rows.npy      int32 postings: item rows
+#   kb_bm25_tf.npy        float32 postings: weighted term frequency
+#   kb_bm25_doclen.npy    float32 (n,) weighted document length
+import json
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+
+from cache import normalize_query
+from ranking import top_k_of
+
+logger = logging.getLogger(__name__)
+
+BM25_META_FILE = "kb_bm25.json"
+BM25_OFFSETS_FILE = "kb_bm25_offsets.npy"
+BM25_ROWS_FILE = "kb_bm25_rows.npy"
+BM25_TF_FILE = "kb_bm25_tf.npy"
+BM25_DOCLEN_FILE = "kb_bm25_doclen.npy"
+
+# A title or tag match counts twice as much as a match in the body text.
+FIELD_WEIGHTS = {"title": 2.0, "tags": 2.0, "text": 1.0}
+
+STOPWORDS = frozenset("""
+a about after all also am an and any are as at be been being but by can could describe did do does
+done explain for from give had has have he her him his how i if in into is it its know list me more
+most my of on or our she show so some tell than that the their them then there these they this those
+to us was we were what when where which who whom whose why will with would you your
+""".split())
+
+
+def tokenize(text: str):
+    return normalize_query(text).split()
+
+
+def query_terms(text: str):
+    # Content terms of a query, deduplicated, in order.
+    return list(dict.fromkeys(t for t in tokenize(text) if t not in STOPWORDS))
+
+
+# --- Build (embed.py) ---
+def item_term_freqs(item) -> dict:
+    tf = {}
+    for field, weight in FIELD_WEIGHTS.items():
+        value = item.get(field) or ""
+        if isinstance(value, (list, tuple)):
+            value = " ".join(map(str, value))
+        for term in tokenize(value):
+            if term not in STOPWORDS:
+                tf[term] = tf.get(term, 0.0) + weight
+    return tf
+
+
+def _raw_array(path: Path, dtype, count: int):
+    return np.memmap(path, dtype=dtype, mode="r", shape=(count,)) if count else np.empty(0, dtype=dtype)
+
+
+class BM25Builder:
+    # Fed batch by batch from embed.py's StoreWriter. Postings are spilled to
+    # raw temp files as (term id, row, tf) triples, so memory holds only the
+    # vocabulary and one batch; write() counting-sorts them into the CSR
+    # layout chunk by chunk.
+    def __init__(self, tmp_dir):
+        self.tmp_dir = Path(tmp_dir)
+        self.term_ids = {}
+        self.n = 0
+        self.postings = 0
+        self._doc_len = []
+        self._paths = {name: self.tmp_dir / f"kb_bm25_{name}.raw.tmp" for name in ("terms", "rows", "tf")}
+        self._files = {name: open(path, "wb") for name, path in self._paths.items()}
+
+    def add(self, items):
+        terms, rows, tfs = [], [], []
+        doc_len = np.zeros(len(items), dtype=np.float32)
+        for j, item in enumerate(items):
+            tf = item_term_freqs(item)
+            doc_len[j] = sum(tf.values())
+            for term, f in tf.items():
+                terms.append(self.term_ids.setdefault(term, len(self.term_ids)))
+                rows.append(self.n + j)
+                tfs.append(f)
+        self._files["terms"].write(np.asarray(terms, dtype=np.int32).tobytes())
+        self._files["rows"].write(np.asarray(rows, dtype=np.int32).tobytes())
+        self._files["tf"].write(np.asarray(tfs, dtype=np.float32).tobytes())
+        self._doc_len.append(doc_len)
+        self.n += len(items)
+        self.postings += len(terms)
+
+    def write(self, kb_dir, store_version: str, k1: float = 1.2, b: float = 0.75, chunk: int = 1 << 20):
+        # Each file goes through a temp file and os.replace, so a running server
+        # never sees a half-written index.
+        kb_dir = Path(kb_dir)
+        for f in self._files.values():
+            f.close()
+        vocab = sorted(self.term_ids)
+        n_terms, n_postings = len(vocab), self.postings
+        rank = np.empty(n_terms, dtype=np.int64)  # term id -> position in vocab
+        rank[[self.term_ids[t] for t in vocab]] = np.arange(n_terms)
+        term_raw = _raw_array(self._paths["terms"], np.int32, n_postings)
+        rows_raw = _raw_array(self._paths["rows"], np.int32, n_postings)
+        tf_raw = _raw_array(self._paths["tf"], np.float32, n_postings)
+
+        counts = np.zeros(n_terms, dtype=np.int64)
+        for start in range(0, n_postings, chunk):
+            counts += np.bincount(rank[term_raw[start:start + chunk]], minlength=n_terms)
+        offsets = np.zeros(n_terms + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(counts)
+
+        rows_tmp = kb_dir / (BM25_ROWS_FILE + ".tmp")
+        tf_tmp = kb_dir / (BM25_TF_FILE + ".tmp")
+        if n_postings:
+            rows_out = np.lib.format.open_memmap(rows_tmp, mode="w+", dtype=np.int32, shape=(n_postings,))
+            tf_out = np.lib.format.open_memmap(tf_tmp, mode="w+", dtype=np.float32, shape=(n_postings,))
+            cursor = offsets[:-1].copy()
+            for start in range(0, n_postings, chunk):
+                keys = rank[term_raw[start:start + chunk]]
+                # stable, so each term's rows stay in ascending order
+                order = np.argsort(keys, kind="stable")
+                sorted_keys = keys[order]
+                run_starts = np.r_[0, np.flatnonzero(np.diff(sorted_keys)) + 1]
+                run_lens = np.diff(np.r_[run_starts, len(sorted_keys)])
+                pos = cursor[sorted_keys] + np.arange(len(sorted_keys)) - np.repeat(run_starts, run_lens)
+                rows_out[pos] = rows_raw[start:start + chunk][order]
+                tf_out[pos] = tf_raw[start:start + chunk][order]
+                cursor[sorted_keys[run_starts]] += run_lens
+            rows_out.flush()
+            tf_out.flush()
+            del rows_out, tf_out
+        else:
+            for path, dtype in ((rows_tmp, np.int32), (tf_tmp, np.float32)):
+                with open(path, "wb") as f:
+                    np.save(f, np.empty(0, dtype=dtype))
+        del term_raw, rows_raw, tf_raw
+        for path in self._paths.values():
+            os.remove(path)
+
+        doc_len = np.concatenate(self._doc_len) if self._doc_len else np.zeros(0, dtype=np.float32)
+        for name, array in ((BM25_OFFSETS_FILE, offsets), (BM25_DOCLEN_FILE, doc_len)):
+            tmp = kb_dir / (name + ".tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp, kb_dir / name)
+        os.replace(rows_tmp, kb_dir / BM25_ROWS_FILE)
+        os.replace(tf_tmp, kb_dir / BM25_TF_FILE)
+        tmp = kb_dir / (BM25_META_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"store_version": store_version, "k1": k1, "b": b,
+                       "fields": FIELD_WEIGHTS, "terms": vocab}, f, ensure_ascii=False)
+        os.replace(tmp, kb_dir / BM25_META_FILE)
+        return n_terms, n_postings
+
+
+# --- Search (server.py) ---
+class BM25Index:
+    def __init__(self, terms, offsets, rows, tfs, doc_len, k1: float = 1.2, b: float = 0.75):
+        self.term_ids = {t: i for i, t in enumerate(terms)}
+        self.offsets = offsets
+        self.rows = rows
+        self.tfs = tfs
+        self.n = len(doc_len)
+        self.k1 = float(k1)
+        df = np.diff(offsets).astype(np.float32)
+        self.df = df
+        self.idf = np.log1p((self.n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        avgdl = float(doc_len.mean()) if self.n else 1.0
+        # per-row length normalisation, precomputed once
+        self.norm = (self.k1 * (1.0 - b + b * doc_len / max(avgdl, 1e-6))).astype(np.float32)
+
+    def __len__(self):
+        return self.n
+
+    def scores(self, terms) -> np.ndarray:
+        out = np.zeros(self.n, dtype=np.float32)
+        for term in terms:
+            i = self.term_ids.get(term)
+            if i is None:
+                continue
+            lo, hi = self.offsets[i], self.offsets[i + 1]
+            rows, tf = self.rows[lo:hi], self.tfs[lo:hi]
+            out[rows] += self.idf[i] * tf * (self.k1 + 1.0) / (tf + self.norm[rows])
+        return out
+
+    def search(self, terms, k: int):
+        # Only rows matching at least one term are returned, best first.
+        scores = self.scores(terms)
+        hits = np.flatnonzero(scores)
+        if not len(hits):
+            return hits.astype(np.int64), scores[hits]
+        order = top_k_of(scores[hits], k)
+        return hits[order].astype(np.int64), scores[hits[order]]
+
+    def is_keyword_query(self, text: str, max_terms: int = 3, max_df: float = 0.25) -> bool:
+        # "YOLO", "CSWA docker": a few terms, no question words, each of them
+        # indexed and selective. Such queries can skip the embedder.
+        tokens = tokenize(text)
+        if not tokens or len(tokens) > max_terms:
+            return False
+        for token in tokens:
+            i = self.term_ids.get(token)
+            if token in STOPWORDS or i is None or self.df[i] > max_df * self.n:
+                return False
+        return True
+
+
+def load_bm25(kb_dir, store_version: str):
+    kb_dir = Path(kb_dir)
+    meta_path = kb_dir / BM25_META_FILE
+    if not meta_path.exists():
+        logger.warning("No BM25 index in %s (re-run embed.py); dense retrieval only", kb_dir)
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("store_version") != store_version:
+        logger.warning("BM25 index was built for another KB version; dense retrieval only")
+        return None
+    return BM25Index(
+        meta["terms"],
+        np.load(kb_dir / BM25_OFFSETS_FILE),
+        np.load(kb_dir / BM25_ROWS_FILE),
+        np.load(kb_dir / BM25_TF_FILE),
+        np.load(kb_dir / BM25_DOCLEN_FILE),
+        k1=meta.get("k1", 1.2), b=meta.get("b", 0.75),
+    )
+
+
+def rrf_fuse(rankings, weights, k: int, rrf_k: int = 60):
+    # Reciprocal-rank fusion: each ranked list contributes weight / (rrf_k + rank).
+    fused = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, row in enumerate(ranking, 1):
+            row = int(row)
+            fused[row] = fused.get(row, 0.0) + weight / (rrf_k + rank)
+    best = sorted(fused.items(), key=lambda kv: -kv[1])[:k]
+    return (np.array([row for row, _ in best], dtype=np.int64),
+            np.array([score for _, score in best], dtype=np.float32))
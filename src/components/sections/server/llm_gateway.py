@@ -0,0 +1,299 @@
+# llm_gateway.py
+# One entry point for chat completions, shared by the Flask (sync) and ASGI
+# (async) servers:
+#   - backends are pluggable: "openai" (any OpenAI-compatible endpoint, e.g.
+#     OPENAI_BASE_URL=http://127.0.0.1:9999/v1 for bench/stub_llm.py) or
+#     "stub" (canned in-process answers, no network)
+#   - the OpenAI clients share one keep-alive connection pool per process
+#   - a process-wide semaphore caps concurrent upstream calls
+#   - 429 / 5xx / connection errors are retried with jittered exponential
+#     backoff (honouring Retry-After); the SDK's own retries are disabled
+#   - with hedge_after > 0, a completion still running after that many seconds
+#     gets a second identical request and the first answer wins
+# Streams are retried only until their first delta and are never hedged.
+import asyncio
+import logging
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import httpx
+import openai
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE = (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)
+
+
+class OpenAIBackend:
+    def __init__(self, api_key: str, max_connections: int = 100, max_keepalive: int = 20,
+                 keepalive_expiry: float = 30.0):
+        self.api_key = api_key
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_keepalive,
+                                   keepalive_expiry=keepalive_expiry)
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+
+    def _check_key(self):
+        if not self.api_key:
+            raise RuntimeError("OpenAI API key not configured.")
+
+    @property
+    def client(self):
+        self._check_key()
+        with self._lock:
+            if self._client is None:
+                self._client = openai.OpenAI(api_key=self.api_key, max_retries=0,
+                                             http_client=openai.DefaultHttpxClient(limits=self.limits))
+        return self._client
+
+    @property
+    def async_client(self):
+        self._check_key()
+        with self._lock:
+            if self._async_client is None:
+                self._async_client = openai.AsyncOpenAI(
+                    api_key=self.api_key, max_retries=0,
+                    http_client=openai.DefaultAsyncHttpxClient(limits=self.limits))
+        return self._async_client
+
+    def complete(self, messages, **params) -> str:
+        response = self.client.chat.completions.create(messages=messages, **params)
+        return response.choices[0].message.content
+
+    def stream(self, messages, **params):
+        stream = self.client.chat.completions.create(messages=messages, stream=True, **params)
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        finally:
+            stream.close()
+
+    async def acomplete(self, messages, **params) -> str:
+        response = await self.async_client.chat.completions.create(messages=messages, **params)
+        return response.choices[0].message.content
+
+    async def astream(self, messages, **params):
+        stream = await self.async_client.chat.completions.create(messages=messages, stream=True, **params)
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        finally:
+            await stream.close()
+
+
+class StubBackend:
+    # Echoes the start of the question after `delay` seconds; for tests and
+    # local runs without an API key.
+    def __init__(self, delay: float = 0.0, **_):
+        self.delay = float(delay)
+
+    def _answer(self, messages) -> str:
+        question = messages[-1]["content"].rsplit("User question:", 1)[-1].strip().splitlines()[0]
+        return f"[stub answer] {question[:200]}"
+
+    def complete(self, messages, **params) -> str:
+        time.sleep(self.delay)
+        return self._answer(messages)
+
+    def stream(self, messages, **params):
+        time.sleep(self.delay)
+        for i, word in enumerate(self._answer(messages).split(" ")):
+            yield word if i == 0 else " " + word
+
+    async def acomplete(self, messages, **params) -> str:
+        await asyncio.sleep(self.delay)
+        return self._answer(messages)
+
+    async def astream(self, messages, **params):
+        await asyncio.sleep(self.delay)
+        for i, word in enumerate(self._answer(messages).split(" ")):
+            yield word if i == 0 else " " + word
+
+
+BACKENDS = {"openai": OpenAIBackend, "stub": StubBackend}
+
+
+def make_backend(name: str, **options):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM backend {name!r}; expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name](**options)
+
+
+def retry_after(exc) -> float:
+    response = getattr(exc, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return 0.0
+
+
+class LLMGateway:
+    def __init__(self, backend, max_concurrency: int = 256, max_retries: int = 3,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0, hedge_after: float = 0.0):
+        self.backend = backend
+        self.max_retries = int(max_retries)
+        self.backoff_base = float(backoff_base)
+        self.backoff_max = float(backoff_max)
+        self.hedge_after = float(hedge_after)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._aslots = asyncio.Semaphore(max_concurrency)
+        self._hedge_pool = ThreadPoolExecutor(max_workers=max(2, max_concurrency),
+                                              thread_name_prefix="llm-hedge") if self.hedge_after > 0 else None
+        self._stats = {"calls": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "failures": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, field: str):
+        with self._stats_lock:
+            self._stats[field] += 1
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def backoff(self, attempt: int, exc) -> float:
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt)) * random.uniform(0.5, 1.0)
+        return min(self.backoff_max, max(delay, retry_after(exc)))
+
+    def _should_retry(self, attempt: int, exc) -> bool:
+        if not isinstance(exc, RETRYABLE) or attempt >= self.max_retries:
+            self._count("failures")
+            return False
+        self._count("retries")
+        logger.warning("LLM call failed (%s), retry %d/%d", type(exc).__name__, attempt + 1, self.max_retries)
+        return True
+
+    # --- sync ---
+    def _call(self, messages, params) -> str:
+        with self._slots:
+            return self.backend.complete(messages, **params)
+
+    def _hedged(self, messages, params) -> str:
+        primary = self._hedge_pool.submit(self._call, messages, params)
+        done, _ = wait([primary], timeout=self.hedge_after)
+        if done:
+            return primary.result()
+        self._count("hedges")
+        backup = self._hedge_pool.submit(self._call, messages, params)
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is backup:
+                        self._count("hedge_wins")
+                    # the slower request can't be cancelled mid-flight; it
+                    # finishes in the background and its answer is dropped
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def complete(self, messages, **params) -> str:
+        self._count("calls")
+        attempt = 0
+        while True:
+            try:
+                if self._hedge_pool is not None:
+                    return self._hedged(messages, params)
+                return self._call(messages, params)
+            except Exception as e:
+                if not self._should_retry(attempt, e):
+                    raise
+                time.sleep(self.backoff(attempt, e))
+                attempt += 1
+
+    def stream(self, messages, **params):
+        self._count("calls")
+        attempt = 0
+        with self._slots:
+            while True:
+                started = False
+                tokens = self.backend.stream(messages, **params)
+                try:
+                    for delta in tokens:
+                        started = True
+                        yield delta
+                    return
+                except Exception as e:
+                    if started or not self._should_retry(attempt, e):
+                        raise
+                    error = e
+                finally:
+                    tokens.close()
+                time.sleep(self.backoff(attempt, error))
+                attempt += 1
+
+    # --- async ---
+    async def _acall(self, messages, params) -> str:
+        async with self._aslots:
+            return await self.backend.acomplete(messages, **params)
+
+    async def _ahedged(self, messages, params) -> str:
+        primary = asyncio.ensure_future(self._acall(messages, params))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_after)
+        if done:
+            return primary.result()
+        self._count("hedges")
+        backup = asyncio.ensure_future(self._acall(messages, params))
+        pending = {primary, backup}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            self._count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def acomplete(self, messages, **params) -> str:
+        self._count("calls")
+        attempt = 0
+        while True:
+            try:
+                if self.hedge_after > 0:
+                    return await self._ahedged(messages, params)
+                return await self._acall(messages, params)
+            except Exception as e:
+                if not self._should_retry(attempt, e):
+                    raise
+                await asyncio.sleep(self.backoff(attempt, e))
+                attempt += 1
+
+    async def astream(self, messages, **params):
+        self._count("calls")
+        attempt = 0
+        async with self._aslots:
+            while True:
+                started = False
+                tokens = self.backend.astream(messages, **params)
+                try:
+                    async for delta in tokens:
+                        started = True
+                        yield delta
+                    return
+                except Exception as e:
+                    if started or not self._should_retry(attempt, e):
+                        raise
+                    error = e
+                finally:
+                    await tokens.aclose()
+                await asyncio.sleep(self.backoff(attempt, error))
+                attempt += 1
@@ -0,0 +1,188 @@
+# metrics.py
+# In-process request metrics exported in Prometheus text format on /metrics.
+#
+#   with trace_request() as trace:   # one per request, holds per-stage timings
+#       with span("encode"):         # any code on the request path (any depth)
+#           ...
+#
+# Spans always feed the global stage histograms; inside a traced request they
+# are also accumulated on the trace, which can be returned to the client. The
+# current trace lives in a ContextVar, so it follows the request into helper
+# threads when the call is made through contextvars.copy_context().run.
+# Metrics are per process: with several workers, scrape each one or aggregate.
+import bisect
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _labels(pairs) -> str:
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{str(v)}"'.replace("\n", " ") for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _num(v) -> str:
+    if isinstance(v, bool):
+        return "1" if v else "0"
+    if isinstance(v, float) and math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Histogram:
+    # Cumulative buckets, sum and count per label set, plus p50/p95/p99 over a
+    # sliding window of the most recent `window` observations. label=None gives
+    # a single unlabelled series.
+    def __init__(self, name: str, help_text: str, label: str = None, buckets=DEFAULT_BUCKETS, window: int = 2048):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self.window = window
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, label_value: str = ""):
+        with self._lock:
+            s = self._series.get(label_value)
+            if s is None:
+                s = self._series[label_value] = {
+                    "counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0,
+                    "recent": deque(maxlen=self.window),
+                }
+            s["counts"][bisect.bisect_left(self.buckets, value)] += 1
+            s["sum"] += value
+            s["count"] += 1
+            s["recent"].append(value)
+
+    def quantiles(self, label_value: str = "") -> dict:
+        with self._lock:
+            s = self._series.get(label_value)
+            recent = sorted(s["recent"]) if s else []
+        if not recent:
+            return {}
+        return {q: recent[min(len(recent) - 1, int(q * len(recent)))] for q in QUANTILES}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        # must differ from the histogram's own name: one TYPE per metric name
+        if self.name.endswith("_seconds"):
+            qname = self.name[:-len("_seconds")] + "_quantile_seconds"
+        else:
+            qname = f"{self.name}_quantile"
+        qlines = [f"# HELP {qname} Recent-window quantiles of {self.name}", f"# TYPE {qname} gauge"]
+        with self._lock:
+            series = {k: (list(v["counts"]), v["sum"], v["count"]) for k, v in self._series.items()}
+        for lv, (counts, total, count) in sorted(series.items()):
+            base = [(self.label, lv)] if self.label else []
+            cum = 0
+            for le, c in zip(self.buckets + (math.inf,), counts):
+                cum += c
+                lines.append(f"{self.name}_bucket{_labels(base + [('le', _num(float(le)))])} {cum}")
+            lines.append(f"{self.name}_sum{_labels(base)} {_num(total)}")
+            lines.append(f"{self.name}_count{_labels(base)} {count}")
+            for q, v in self.quantiles(lv).items():
+                qlines.append(f"{qname}{_labels(base + [('quantile', q)])} {_num(v)}")
+        return lines + qlines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(k, "")) for k in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, v in items:
+            lines.append(f"{self.name}{_labels(list(zip(self.labels, key)))} {_num(v)}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("chatbot_stage_duration_seconds",
+                          "Time spent per request-pipeline stage", "stage")
+CONTEXT_TOKENS = Histogram("chatbot_context_tokens", "Tokens of KB context packed into each prompt",
+                           buckets=(100, 250, 500, 750, 1000, 1500, 2000, 3000, 4000))
+REQUESTS = Counter("chatbot_requests_total", "HTTP requests by route and status", ("route", "status"))
+_collectors = []
+
+
+def register_collector(fn):
+    # fn() -> iterable of (metric_name, labels_dict, value, help) gauges, sampled at scrape time
+    _collectors.append(fn)
+
+
+class Trace:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def as_ms(self) -> dict:
+        out = {k: round(v * 1000.0, 3) for k, v in self.stages.items()}
+        out["total"] = round((time.perf_counter() - self.start) * 1000.0, 3)
+        return out
+
+
+_current = ContextVar("chatbot_trace", default=None)
+
+
+def observe(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage)
+    trace = _current.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+
+@contextmanager
+def span(stage: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - t0)
+
+
+@contextmanager
+def trace_request():
+    trace = Trace()
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+        STAGE_SECONDS.observe(time.perf_counter() - trace.start, "total")
+
+
+def render() -> str:
+    lines = STAGE_SECONDS.render() + CONTEXT_TOKENS.render() + REQUESTS.render()
+    gauges = {}  # samples of one metric must be contiguous in the output
+    for collect in _collectors:
+        for name, labels, value, help_text in collect():
+            if value is None:
+                continue
+            gauges.setdefault(name, (help_text, []))[1].append(
+                f"{name}{_labels(sorted(labels.items()))} {_num(value)}")
+    for name, (help_text, samples) in gauges.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"] + samples
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,150 @@
+# onnx_encoder.py
+# Torch-free query encoder: the sentence-transformers model exported to ONNX
+# (optionally with int8 weights) and run with onnxruntime, tokenized with the
+# `tokenizers` package. Pooling matches SentenceTransformer.encode (mean over
+# the attention mask, optional L2 normalization), so vectors can be searched
+# against a kb_store embedded by the PyTorch model. Exported by
+# `embed.py --export-onnx`, served with EMBEDDER_BACKEND=onnx.
+#
+#   onnx_meta.json   model name, dim, max_seq_length, padding, model file and the
+#                    parity result against the PyTorch model; written last
+#   model.onnx       float32 graph (input_ids, attention_mask[, token_type_ids]);
+#                    newer torch exporters keep its weights in model.onnx.data
+#   model_int8.onnx  dynamically quantized copy (--onnx-int8)
+#   tokenizer.json   fast tokenizer
+#
+# Serving needs onnxruntime and tokenizers only (requirements-onnx.txt); the
+# export additionally needs torch, onnx and, for int8, onnxruntime.
+import json
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ONNX_META_FILE = "onnx_meta.json"
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_INT8_FILE = "model_int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+
+
+def mean_pool(hidden: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    mask = mask[..., None].astype(np.float32)
+    return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+
+# --- Export (embed.py) ---
+def export_onnx(model, model_name: str, out_dir, int8: bool = False, opset: int = 17) -> dict:
+    # model: a loaded SentenceTransformer. Returns the meta dict; the caller
+    # writes it with write_onnx_meta once the parity check has passed.
+    import torch
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    # a previous export stays unusable until this one passes its parity check
+    (out_dir / ONNX_META_FILE).unlink(missing_ok=True)
+    # transformer -> mean pooling [-> normalize] is all that is reimplemented here
+    config = model[1].get_config_dict() if len(model) > 1 else {}
+    pooling = config.get("pooling_mode") or "+".join(
+        k[len("pooling_mode_"):] for k, v in config.items() if k.startswith("pooling_mode_") and v is True)
+    extra = [type(m).__name__ for m in list(model)[2:] if type(m).__name__ != "Normalize"]
+    if pooling not in ("mean", "mean_tokens") or extra:
+        raise ValueError(f"{model_name}: {pooling} pooling {extra or ''} is not supported; expected mean pooling")
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+    tokenizer.backend_tokenizer.save(str(out_dir / TOKENIZER_FILE))
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    inputs = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic = {name: {0: "batch", 1: "tokens"} for name in inputs}
+    dynamic["last_hidden_state"] = {0: "batch", 1: "tokens"}
+    with torch.no_grad():
+        torch.onnx.export(transformer, tuple(sample[name] for name in inputs), str(out_dir / ONNX_MODEL_FILE),
+                          input_names=inputs, output_names=["last_hidden_state"],
+                          dynamic_axes=dynamic, opset_version=opset)
+    model_file = ONNX_MODEL_FILE
+    if int8:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(str(out_dir / ONNX_MODEL_FILE), str(out_dir / ONNX_INT8_FILE), weight_type=QuantType.QInt8)
+        model_file = ONNX_INT8_FILE
+    return {"model": model_name, "dim": model.get_sentence_embedding_dimension(),
+            "max_seq_length": model.max_seq_length, "file": model_file, "inputs": inputs,
+            "pad_token": tokenizer.pad_token, "pad_id": tokenizer.pad_token_id}
+
+
+def parity(reference: np.ndarray, candidate: np.ndarray) -> dict:
+    # Both row-normalized; cosine per sentence plus the largest element difference.
+    cosine = np.sum(reference * candidate, axis=1)
+    return {"sentences": len(cosine), "min_cosine": float(cosine.min()),
+            "mean_cosine": float(cosine.mean()), "max_abs_diff": float(np.abs(reference - candidate).max())}
+
+
+def write_onnx_meta(out_dir, meta: dict):
+    out_dir = Path(out_dir)
+    tmp = out_dir / (ONNX_META_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp, out_dir / ONNX_META_FILE)
+
+
+# --- Inference (server.py) ---
+class OnnxEncoder:
+    # Drop-in for the SentenceTransformer.encode calls made by server.py.
+    def __init__(self, model_dir, threads: int = 0, meta: dict = None):
+        # meta: only for checking a fresh export before its onnx_meta.json exists
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_dir = Path(model_dir)
+        if meta is None:
+            meta_path = model_dir / ONNX_META_FILE
+            if not meta_path.exists():
+                raise FileNotFoundError(f"No {ONNX_META_FILE} in {model_dir}; run embed.py --export-onnx")
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        self.meta = meta
+        self.model_name = self.meta["model"]
+        self.dim = int(self.meta["dim"])
+
+        self.tokenizer = Tokenizer.from_file(str(model_dir / TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=int(self.meta["max_seq_length"]))
+        self.tokenizer.enable_padding(pad_id=int(self.meta["pad_id"]), pad_token=self.meta["pad_token"])
+
+        options = ort.SessionOptions()
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(str(model_dir / self.meta["file"]), options,
+                                            providers=["CPUExecutionProvider"])
+        self.inputs = [i.name for i in self.session.get_inputs()]
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def _encode_batch(self, sentences) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(sentences)
+        feed = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {name: feed[name] for name in self.inputs})[0]
+        return mean_pool(hidden, feed["attention_mask"])
+
+    def encode(self, sentences, batch_size: int = 32, convert_to_numpy: bool = True,
+               normalize_embeddings: bool = False, **_):
+        single = isinstance(sentences, str)
+        sentences = [sentences] if single else list(sentences)
+        batch_size = max(1, int(batch_size))
+        if not sentences:
+            return np.empty((0, self.dim), dtype=np.float32)
+        # sort by length so each batch pads to similar lengths, as SentenceTransformer does
+        order = np.argsort([-len(s) for s in sentences], kind="stable")
+        out = np.empty((len(sentences), self.dim), dtype=np.float32)
+        for start in range(0, len(sentences), batch_size):
+            rows = order[start:start + batch_size]
+            out[rows] = self._encode_batch([sentences[i] for i in rows])
+        if normalize_embeddings:
+            out /= np.linalg.norm(out, axis=1, keepdims=True) + 1e-12
+        return out[0] if single else out
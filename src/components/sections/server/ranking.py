@@ -0,0 +1,159 @@
+# ranking.py
+# Load-time ranking model: every per-item term of the retrieval score that does
+# not depend on the query is folded into one bias vector, and text and title
+# similarity come from one stacked matrix, so a query costs one matmul.
+import re
+from typing import Optional
+
+import numpy as np
+
+
+def extract_most_recent_year(text: str) -> Optional[int]:
+    if not text:
+        return None
+    years = re.findall(r"(?:19|20)\d{2}", text)
+    return max(map(int, years)) if years else None
+
+
+def normalize_rows(x):
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=1, keepdims=True) + 1e-12
+    return x / norms
+
+
+def static_bias(kb_items, gamma_priority: float, id_boosts: dict,
+                recency_base_year: int, recency_scale: float) -> np.ndarray:
+    bias = np.zeros(len(kb_items), dtype=np.float32)
+    for idx, it in enumerate(kb_items):
+        priority = float(it.get("priority", 0.0) or 0.0)
+        value = gamma_priority * priority
+        item_id = it.get("id")
+        if item_id in id_boosts:
+            value += float(id_boosts[item_id])
+        year = it.get("year") or extract_most_recent_year(it.get("text", ""))
+        if year:
+            value += max(0, int(year) - recency_base_year) * recency_scale
+        bias[idx] = value
+    return bias
+
+
+def top_k_of(scores: np.ndarray, k: int) -> np.ndarray:
+    n = scores.shape[0]
+    k = max(0, min(int(k), n))
+    if k == 0:
+        return np.empty(0, dtype=np.intp)
+    cand = np.argpartition(-scores, k - 1)[:k] if k < n else np.arange(n)
+    return cand[np.argsort(-scores[cand], kind="stable")]
+
+
+class RankingModel:
+    # vectors is the stacked (n, 2 * dim) [text | title] matrix from kb_store, so
+    #   score(q) = alpha * (T . q) + beta * (H . q) + bias
+    #            = [T | H] . [alpha * q ; beta * q] + bias
+    # The weights go on the query rather than the matrix, so a memory-mapped
+    # matrix is used as is without a per-process weighted copy.
+    def __init__(self, kb_items, vectors, alpha_text: float, beta_title: float,
+                 gamma_priority: float, id_boosts: dict, recency_base_year: int,
+                 recency_scale: float):
+        if vectors.dtype != np.float32 or vectors.ndim != 2 or vectors.shape[1] % 2:
+            raise ValueError("vectors must be a float32 (n, 2 * dim) matrix")
+        if vectors.shape[0] != len(kb_items):
+            raise ValueError("embedding rows do not match number of KB items")
+        self.matrix = vectors
+        self.dim = vectors.shape[1] // 2
+        self.alpha_text = float(alpha_text)
+        self.beta_title = float(beta_title)
+        self.bias = static_bias(kb_items, gamma_priority, id_boosts,
+                                recency_base_year, recency_scale)
+        self.bias.flags.writeable = False
+
+    @classmethod
+    def from_embeddings(cls, kb_items, text_embeddings, title_embeddings, **weights):
+        text_embeddings = np.asarray(text_embeddings, dtype=np.float32)
+        title_embeddings = np.asarray(title_embeddings, dtype=np.float32)
+        if text_embeddings.shape != title_embeddings.shape:
+            raise ValueError("text and title embeddings must have the same shape")
+        vectors = np.ascontiguousarray(np.hstack([text_embeddings, title_embeddings]))
+        vectors.flags.writeable = False
+        return cls(kb_items, vectors, **weights)
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def weighted_query(self, q: np.ndarray) -> np.ndarray:
+        q = np.asarray(q, dtype=np.float32)
+        return np.concatenate([self.alpha_text * q, self.beta_title * q]).astype(np.float32)
+
+    def score(self, q: np.ndarray) -> np.ndarray:
+        return self.matrix @ self.weighted_query(q) + self.bias
+
+    def top_k(self, q: np.ndarray, k: int):
+        scores = self.score(q)
+        idxs = top_k_of(scores, k)
+        return idxs, scores[idxs]
+
+    def score_many(self, queries: np.ndarray) -> np.ndarray:
+        # (m, dim) queries -> (m, n) scores with one matrix-matrix product
+        queries = np.asarray(queries, dtype=np.float32)
+        weighted = np.hstack([self.alpha_text * queries, self.beta_title * queries]).astype(np.float32)
+        return weighted @ self.matrix.T + self.bias
+
+    def top_k_many(self, queries: np.ndarray, k: int, block_queries: int = 256):
+        # block_queries bounds the (block, n) score temporary on large KBs
+        out = []
+        for start in range(0, len(queries), block_queries):
+            for scores in self.score_many(queries[start:start + block_queries]):
+                idxs = top_k_of(scores, k)
+                out.append((idxs, scores[idxs]))
+        return out
+
+
+class QuantizedRankingModel(RankingModel):
+    # Scores against an int8 (with per-row text/title scales) or float16 copy of
+    # the stacked matrix, then re-ranks the best `rerank` candidates with the
+    # float32 rows. The float32 matrix stays memory-mapped, so only re-ranked rows
+    # are ever paged in. NumPy has no int8/float16 GEMM, so blocks are widened
+    # to float32 on the fly (block_rows at a time) to keep temporaries small.
+    def __init__(self, kb_items, vectors, qvectors, scales=None, rerank: int = 50,
+                 block_rows: int = 2048, **weights):
+        super().__init__(kb_items, vectors, **weights)
+        if qvectors.shape != vectors.shape:
+            raise ValueError("quantized vectors must have the same shape as the float32 vectors")
+        if qvectors.dtype == np.int8 and (scales is None or scales.shape != (len(kb_items), 2)):
+            raise ValueError("int8 vectors need (n, 2) per-row scales")
+        self.qvectors = qvectors
+        self.scales = scales
+        self.rerank = int(rerank)
+        self.block_rows = int(block_rows)
+
+    def approx_score(self, q: np.ndarray) -> np.ndarray:
+        q = np.asarray(q, dtype=np.float32)
+        wt, wh = self.alpha_text * q, self.beta_title * q
+        d = self.dim
+        out = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), self.block_rows):
+            block = np.asarray(self.qvectors[start:start + self.block_rows], dtype=np.float32)
+            st, sh = block[:, :d] @ wt, block[:, d:] @ wh
+            if self.scales is not None:
+                sc = self.scales[start:start + self.block_rows]
+                st, sh = st * sc[:, 0], sh * sc[:, 1]
+            out[start:start + len(block)] = st + sh
+        return out + self.bias
+
+    def score(self, q: np.ndarray) -> np.ndarray:
+        return self.approx_score(q)
+
+    def top_k(self, q: np.ndarray, k: int):
+        approx = self.approx_score(q)
+        if self.rerank <= 0:
+            idxs = top_k_of(approx, k)
+            return idxs, approx[idxs]
+        cand = np.sort(top_k_of(approx, max(int(k), self.rerank)))
+        exact = self.matrix[cand] @ self.weighted_query(q) + self.bias[cand]
+        order = top_k_of(exact, k)
+        return cand[order], exact[order]
+
+    def top_k_many(self, queries: np.ndarray, k: int, block_queries: int = 256):
+        # A float32 matrix-matrix product would page in the whole float32 matrix
+        # this model exists to avoid, so batches are scored query by query.
+        return [self.top_k(q, k) for q in queries]
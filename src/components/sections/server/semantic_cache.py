@@ -0,0 +1,120 @@
+# semantic_cache.py
+# Answer cache for paraphrased questions. Entries hold the normalized query
+# embedding, the retrieved KB ids, the model and the answer. A lookup hits when
+# a stored query is at least `threshold` cosine-similar AND retrieval returned
+# the same KB ids in the same order for the same model, i.e. the LLM would have
+# seen the same context.
+#
+# False hits cannot be detected from the cache alone, so a sample of hits
+# (audit_rate) is answered by the LLM anyway; the fresh and cached answers are
+# compared by embedding similarity and disagreements counted as false hits.
+import random
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional, Sequence
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    def __init__(self, dim: int, max_entries: int = 512, threshold: float = 0.95,
+                 audit_rate: float = 0.0, audit_min_similarity: float = 0.8,
+                 encode_fn: Optional[Callable[[Sequence[str]], np.ndarray]] = None):
+        self.max_entries = max(0, int(max_entries))
+        self.threshold = float(threshold)
+        self.audit_rate = float(audit_rate)
+        self.audit_min_similarity = float(audit_min_similarity)
+        self.encode_fn = encode_fn
+        self._vecs = np.zeros((self.max_entries, dim), dtype=np.float32)
+        self._entries = [None] * self.max_entries   # slot -> (ids, model, answer, sources)
+        self._lru = OrderedDict()                    # slot -> None, least recent first
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.context_mismatches = 0
+        self.evictions = 0
+        self.audits = 0
+        self.audit_false_hits = 0
+
+    def __len__(self):
+        return len(self._lru)
+
+    def _best(self, q, ids, model):
+        # (slot, similarity) of the most similar entry with a matching context.
+        if not self._lru:
+            return None, 0.0
+        sims = self._vecs @ q
+        order = np.argsort(-sims)
+        for slot in order:
+            sim = float(sims[slot])
+            if sim < self.threshold:
+                break
+            entry = self._entries[slot]
+            if entry is None:
+                continue
+            if entry[0] == ids and entry[1] == model:
+                return int(slot), sim
+            self.context_mismatches += 1
+        return None, 0.0
+
+    def lookup(self, q: np.ndarray, item_ids: Sequence[str], model: str) -> Optional[dict]:
+        if self.max_entries == 0:
+            return None
+        ids = tuple(item_ids)
+        with self._lock:
+            self.lookups += 1
+            slot, sim = self._best(np.asarray(q, dtype=np.float32), ids, model)
+            if slot is None:
+                return None
+            self.hits += 1
+            self._lru.move_to_end(slot)
+            _, _, answer, sources = self._entries[slot]
+        return {"answer": answer, "sources": list(sources), "similarity": sim,
+                "audit": random.random() < self.audit_rate}
+
+    def add(self, q: np.ndarray, item_ids: Sequence[str], model: str, answer: str, sources: Sequence[str]):
+        if self.max_entries == 0:
+            return
+        ids = tuple(item_ids)
+        q = np.asarray(q, dtype=np.float32)
+        with self._lock:
+            if len(self._lru) < self.max_entries:
+                slot = next(i for i, e in enumerate(self._entries) if e is None)
+            else:
+                slot, _ = self._lru.popitem(last=False)
+                self.evictions += 1
+            self._vecs[slot] = q
+            self._entries[slot] = (ids, model, answer, tuple(sources))
+            self._lru[slot] = None
+
+    def audit(self, cached_answer: str, fresh_answer: str) -> float:
+        vecs = np.asarray(self.encode_fn([cached_answer, fresh_answer]), dtype=np.float32)
+        vecs = vecs / (np.linalg.norm(vecs, axis=1, keepdims=True) + 1e-12)
+        sim = float(vecs[0] @ vecs[1])
+        with self._lock:
+            self.audits += 1
+            if sim < self.audit_min_similarity:
+                self.audit_false_hits += 1
+        return sim
+
+    def clear(self):
+        with self._lock:
+            self._vecs[:] = 0.0
+            self._entries = [None] * self.max_entries
+            self._lru.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._lru),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": (self.hits / self.lookups) if self.lookups else 0.0,
+                "context_mismatches": self.context_mismatches,
+                "evictions": self.evictions,
+                "audits": self.audits,
+                "audit_false_hits": self.audit_false_hits,
+                "false_hit_rate": (self.audit_false_hits / self.audits) if self.audits else None,
+            }
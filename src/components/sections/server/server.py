@@ -1,28 +1,126 @@
 # server.py (Memory-optimized)
 import os
 import json
+import hmac
 import logging
-import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
 
 import numpy as np
 from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
-from sentence_transformers import SentenceTransformer
-import openai
+
+from answer_cache import AnswerCache
+from cache import TTLCache, normalize_query
+from context_packer import pack_context
+from embed_batcher import MicroBatcher
+from semantic_cache import SemanticAnswerCache
+from intents import load_router
+import metrics
+from metrics import span, trace_request
+from kb_store import stored_version
+from llm_gateway import LLMGateway, make_backend
+from knowledge_base import open_kb, validate_kb
+from kb_registry import KBRegistry, Tenant, UnknownKB, parse_kb_dirs
+from lexical import query_terms, rrf_fuse
 
 # --- Config ---
 KB_DIR = Path("kb_store")
-KB_ITEMS_PATH = KB_DIR / "kb_items.json"
-KB_EMB_PATH = KB_DIR / "kb_embeddings.npz"
+
+# Several KBs in one process: KB_DIRS="docs=/srv/kb/docs,faq=/srv/kb/faq" and/or
+# KB_ROOT, whose subdirectories are KBs named after them. Requests choose one
+# with "kb"; without it they get DEFAULT_KB (KB_DIR unless KB_DIRS names it).
+# Other KBs load on first use and at most MAX_RESIDENT_KBS stay in memory,
+# least recently used out first. All of them share one embedder.
+DEFAULT_KB = os.environ.get("DEFAULT_KB", "default").strip()
+KB_DIRS = os.environ.get("KB_DIRS", "").strip()
+KB_ROOT = os.environ.get("KB_ROOT", "").strip()
+MAX_RESIDENT_KBS = int(os.environ.get("MAX_RESIDENT_KBS", 8))
 
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "").strip()
 OPENAI_MODEL = os.environ.get("OPENAI_MODEL", "gpt-3.5-turbo").strip()
 
 OLLAMA_TIMEOUT = 120
+LLM_MAX_TOKENS = 1500
+LLM_TEMPERATURE = 0.3
+
+# LLM gateway: "openai" talks to OPENAI_BASE_URL (default api.openai.com),
+# "stub" answers in-process for tests. Retries back off exponentially on
+# 429/5xx; LLM_HEDGE_AFTER > 0 sends a second request when the first is slower
+# than that many seconds.
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "openai").strip().lower()
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", 256))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 3))
+LLM_BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", 0.5))
+LLM_BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", 8.0))
+LLM_HEDGE_AFTER = float(os.environ.get("LLM_HEDGE_AFTER", 0))
+LLM_POOL_CONNECTIONS = int(os.environ.get("LLM_POOL_CONNECTIONS", 100))
+LLM_POOL_KEEPALIVE = int(os.environ.get("LLM_POOL_KEEPALIVE", 20))
+LLM_KEEPALIVE_EXPIRY = float(os.environ.get("LLM_KEEPALIVE_EXPIRY", 30))
 TOP_K = int(os.environ.get("TOP_K", 5))  # Increased to get more context
-MAX_CONTEXT_CHARS = 6000  # Increased to include more information
+# Prompt context is packed from whole KB items, in score order, up to this
+# many tokens (roughly the old 6000-character cap).
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 1500))
+
+QUERY_CACHE_MAX_ENTRIES = int(os.environ.get("QUERY_CACHE_MAX_ENTRIES", 2048))
+QUERY_CACHE_TTL = float(os.environ.get("QUERY_CACHE_TTL", 3600))  # seconds, 0 = no expiry
+
+# Concurrent query encodes arriving within EMBED_BATCH_MAX_WAIT_MS are merged
+# into one encode call. EMBED_BATCH_MAX_SIZE=1 encodes each query on its own.
+EMBED_BATCH_MAX_SIZE = int(os.environ.get("EMBED_BATCH_MAX_SIZE", 32))
+EMBED_BATCH_MAX_WAIT_MS = float(os.environ.get("EMBED_BATCH_MAX_WAIT_MS", 2))
+
+# Load the embedder and run a dummy encode in a background thread at startup,
+# so /readyz turns ready before the first user query instead of after it.
+EMBEDDER_WARMUP = os.environ.get("EMBEDDER_WARMUP", "1").strip().lower() not in ("0", "false", "no", "off")
+
+# Query embedder: "sentence-transformers" loads the PyTorch model; "onnx" runs
+# the export from `embed.py --export-onnx` (ONNX_MODEL_DIR) on onnxruntime and
+# never imports torch. A load + first encode slower than
+# EMBEDDER_STARTUP_BUDGET seconds is logged and flagged on /readyz (0 = off).
+EMBEDDER_MODEL = "sentence-transformers/paraphrase-MiniLM-L3-v2"
+EMBEDDER_BACKEND = os.environ.get("EMBEDDER_BACKEND", "sentence-transformers").strip().lower()
+ONNX_MODEL_DIR = os.environ.get("ONNX_MODEL_DIR", "onnx_model").strip()
+ONNX_THREADS = int(os.environ.get("ONNX_THREADS", 0))  # 0 = onnxruntime default
+EMBEDDER_STARTUP_BUDGET = float(os.environ.get("EMBEDDER_STARTUP_BUDGET", 0))
+
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", 1024))  # 0 disables
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", 24 * 3600))
+ANSWER_CACHE_PATH = os.environ.get("ANSWER_CACHE_PATH", "").strip()  # e.g. kb_store/answers.sqlite3
+
+# Paraphrase cache: reuse an answer when a past question is this cosine-similar
+# and retrieved the same KB ids in the same order. Off by default: paraphrases
+# asking for different facts ("your email" / "your phone") can retrieve the same
+# ids and would get the wrong answer without the LLM seeing the question. A
+# SEMANTIC_CACHE_AUDIT_RATE fraction of hits is re-answered by the LLM to
+# estimate the false-hit rate.
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", 0))  # 0 disables, e.g. 512
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", 0.95))
+SEMANTIC_CACHE_AUDIT_RATE = float(os.environ.get("SEMANTIC_CACHE_AUDIT_RATE", 0.05))
+
+# /api/query/batch: max questions per request and concurrent LLM calls per batch
+BATCH_MAX_QUESTIONS = int(os.environ.get("BATCH_MAX_QUESTIONS", 500))
+BATCH_LLM_CONCURRENCY = int(os.environ.get("BATCH_LLM_CONCURRENCY", 8))
+
+# Retrieval: "hybrid" fuses dense and BM25 rankings by reciprocal-rank fusion
+# (RRF_K, per-ranking weights, HYBRID_CANDIDATES deep each); "dense" ignores
+# BM25. With LEXICAL_PREFILTER, keyword-only queries ("YOLO", "CSWA") are
+# answered from BM25 alone and never touch the embedder.
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "hybrid").strip().lower()
+HYBRID_DENSE_WEIGHT = float(os.environ.get("HYBRID_DENSE_WEIGHT", 1.0))
+HYBRID_LEXICAL_WEIGHT = float(os.environ.get("HYBRID_LEXICAL_WEIGHT", 1.0))
+HYBRID_CANDIDATES = int(os.environ.get("HYBRID_CANDIDATES", 50))
+RRF_K = int(os.environ.get("RRF_K", 60))
+LEXICAL_PREFILTER = os.environ.get("LEXICAL_PREFILTER", "1").strip().lower() not in ("0", "false", "no", "off")
+LEXICAL_PREFILTER_MAX_TERMS = int(os.environ.get("LEXICAL_PREFILTER_MAX_TERMS", 3))
+
+# Poll kb_store every KB_RELOAD_INTERVAL seconds and swap in a rebuilt KB
+# without a restart (0 = off). POST /api/kb/reload does the same on demand
+# when ADMIN_TOKEN is set.
+KB_RELOAD_INTERVAL = float(os.environ.get("KB_RELOAD_INTERVAL", 0))
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "").strip()
 
 ALPHA_TEXT = 0.8  # Increased weight on text content
 BETA_TITLE = 1.0
@@ -30,6 +128,19 @@ GAMMA_PRIORITY = 1.2  # Increased priority weight
 RECENCY_BASE_YEAR = 2018
 RECENCY_SCALE = 0.05
 
+# "exact" scans every vector; "ivf" uses the index built by `embed.py --index ivf`
+# and scores only the IVF_NPROBE nearest lists.
+INDEX_KIND = os.environ.get("INDEX_KIND", "exact").strip()
+IVF_NPROBE = int(os.environ.get("IVF_NPROBE", 8))
+
+# "int8" or "float16" scores against the copy written by `embed.py --quantize`
+# and re-ranks the best RERANK_CANDIDATES with float32 (0 disables re-ranking).
+# This trades accuracy for resident memory only: NumPy widens the rows back to
+# float32, so scoring is slower than plain float32 (bench/bench_quantized.py).
+# Ignored with INDEX_KIND=ivf, which scores its candidates in float32.
+EMBED_QUANTIZATION = os.environ.get("EMBED_QUANTIZATION", "none").strip().lower()
+RERANK_CANDIDATES = int(os.environ.get("RERANK_CANDIDATES", 50))
+
 ID_BOOSTS = {"humly": 1.5, "outliar": 1.3, "meliox": 0.5, "skills": 2.0, "education": 1.5, "contact": 1.5, "languages": 1.5}
 
 WORK_INTENT_PATTERNS = [
@@ -48,6 +159,18 @@ GREETING_PATTERNS = [
 
 NAME_PATTERNS = [r"\bwhat('?s| is) your name\b", r"\bwho are you\b"]
 
+NAME_ANSWER = "I'm Omar Dalal's portfolio assistant. You can ask me about Omar's skills, experience, projects, education, and more!"
+GREETING_ANSWER = "Hi! 👋 I'm Omar Dalal's portfolio assistant. Ask me anything about Omar's experience, skills, projects, or background!"
+
+# Built-in intents in priority order; INTENTS_PATH may add canned answers, e.g.
+# [{"name": "cv", "patterns": ["\\b(cv|resume)\\b"], "answer": "..."}]
+DEFAULT_INTENTS = [
+    {"name": "name", "patterns": NAME_PATTERNS, "answer": NAME_ANSWER},
+    {"name": "greeting", "patterns": GREETING_PATTERNS, "answer": GREETING_ANSWER},
+    {"name": "work", "patterns": WORK_INTENT_PATTERNS},
+]
+INTENTS_PATH = os.environ.get("INTENTS_PATH", "intents.json").strip()
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -56,118 +179,536 @@ app = Flask(__name__)
 CORS(app, origins="*")
 
 # --- OpenAI init ---
-if not OPENAI_API_KEY:
+if LLM_BACKEND == "openai" and not OPENAI_API_KEY:
     logger.warning("OPENAI_API_KEY not set. OpenAI calls will fail until configured.")
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+llm = LLMGateway(
+    make_backend(LLM_BACKEND, api_key=OPENAI_API_KEY, max_connections=LLM_POOL_CONNECTIONS,
+                 max_keepalive=LLM_POOL_KEEPALIVE, keepalive_expiry=LLM_KEEPALIVE_EXPIRY),
+    max_concurrency=LLM_MAX_CONCURRENCY, max_retries=LLM_MAX_RETRIES,
+    backoff_base=LLM_BACKOFF_BASE, backoff_max=LLM_BACKOFF_MAX, hedge_after=LLM_HEDGE_AFTER,
+)
 
 # --- Load KB and embeddings ---
-if not KB_ITEMS_PATH.exists() or not KB_EMB_PATH.exists():
-    raise FileNotFoundError("kb_items.json or kb_embeddings.npz not found in kb_store. Run embed.py first.")
-
-with open(KB_ITEMS_PATH, "r", encoding="utf-8") as f:
-    kb_items = json.load(f)
+# kb_vectors.npy is memory-mapped read-only and already normalized by embed.py.
+ranking_weights = dict(
+    alpha_text=ALPHA_TEXT, beta_title=BETA_TITLE, gamma_priority=GAMMA_PRIORITY,
+    id_boosts=ID_BOOSTS, recency_base_year=RECENCY_BASE_YEAR, recency_scale=RECENCY_SCALE,
+)
+
+def load_kb(kb_dir=KB_DIR):
+    return open_kb(kb_dir, ranking_weights, quantization=EMBED_QUANTIZATION, rerank=RERANK_CANDIDATES,
+                   index_kind=INDEX_KIND, nprobe=IVF_NPROBE, lexical=RETRIEVAL_MODE == "hybrid")
+
+def answer_cache_path(name: str):
+    # DEFAULT_KB keeps ANSWER_CACHE_PATH; others get answers.<name>.sqlite3 next to it
+    if not ANSWER_CACHE_PATH or name == DEFAULT_KB:
+        return ANSWER_CACHE_PATH or None
+    path = Path(ANSWER_CACHE_PATH)
+    return str(path.with_name(f"{path.stem}.{name}{path.suffix}"))
+
+def open_tenant(name: str, kb_dir) -> Tenant:
+    with span("kb_load"):
+        kb = load_kb(kb_dir)
+        # every KB is queried with the shared embedder, so it must match the default's
+        validate_kb(kb, None if name == DEFAULT_KB else kb_registry.get(DEFAULT_KB).kb)
+    logger.info("KB %r: %s index over %d items%s", name, kb.index.kind, len(kb),
+                " + BM25" if kb.lexical is not None else "")
+    # Any rebuild of a store changes its version, which invalidates cached answers.
+    answer_cache = AnswerCache(kb.version, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL,
+                               path=answer_cache_path(name))
+    semantic_cache = SemanticAnswerCache(
+        kb.store.dim, SEMANTIC_CACHE_MAX_ENTRIES, SEMANTIC_CACHE_THRESHOLD,
+        audit_rate=SEMANTIC_CACHE_AUDIT_RATE, encode_fn=encode_queries,
+    )
+    return Tenant(name, Path(kb_dir), kb, answer_cache, semantic_cache)
 
-npz = np.load(KB_EMB_PATH, allow_pickle=True)
-kb_embeddings = np.asarray(npz["embeddings"], dtype=np.float32)
-title_embeddings = np.asarray(npz["title_embeddings"], dtype=np.float32)
-ids = list(npz["ids"])
+kb_registry = KBRegistry({DEFAULT_KB: KB_DIR, **parse_kb_dirs(KB_DIRS)}, open_tenant, root=KB_ROOT or None,
+                         max_resident=MAX_RESIDENT_KBS, pinned=(DEFAULT_KB,))
 
-kb_embeddings.flags.writeable = False
-title_embeddings.flags.writeable = False
+def get_tenant(name=None) -> Tenant:
+    # Raises UnknownKB for names that map to no store.
+    return kb_registry.get(name or DEFAULT_KB)
 
 # --- Lazy CPU-only embedder + query cache ---
+if EMBEDDER_BACKEND not in ("sentence-transformers", "onnx"):
+    raise ValueError(f"Unknown EMBEDDER_BACKEND {EMBEDDER_BACKEND!r}; expected sentence-transformers or onnx")
+
 _embedder = None
-_query_cache = {}
+_embedder_lock = threading.Lock()
+_query_cache = TTLCache(QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_TTL, sizeof=lambda v: v.nbytes)
+
+def load_embedder():
+    if EMBEDDER_BACKEND == "onnx":
+        from onnx_encoder import OnnxEncoder
+        logger.info("Loading ONNX encoder from %s", ONNX_MODEL_DIR)
+        encoder = OnnxEncoder(ONNX_MODEL_DIR, threads=ONNX_THREADS)
+        if encoder.model_name != EMBEDDER_MODEL:
+            raise RuntimeError(f"{ONNX_MODEL_DIR} holds {encoder.model_name}, expected {EMBEDDER_MODEL}")
+        return encoder
+    os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    from sentence_transformers import SentenceTransformer
+    logger.info("Loading SentenceTransformer model on CPU")
+    return SentenceTransformer(EMBEDDER_MODEL, device="cpu")
 
 def get_embedder():
     global _embedder
     if _embedder is None:
-        os.environ["CUDA_VISIBLE_DEVICES"] = ""
-        logger.info("Loading SentenceTransformer model on CPU")
-        _embedder = SentenceTransformer("sentence-transformers/paraphrase-MiniLM-L3-v2", device="cpu")
+        # requests arriving during warmup wait here instead of loading a second copy
+        with _embedder_lock:
+            if _embedder is None:
+                with span("embedder_load"):
+                    _embedder = load_embedder()
     return _embedder
 
-def get_query_embedding(query: str):
-    if query in _query_cache:
-        return _query_cache[query]
+def encode_queries(queries):
     embedder = get_embedder()
-    q_emb = embedder.encode(query, convert_to_numpy=True, normalize_embeddings=True)
+    with span("encode_batch"):
+        return embedder.encode(list(queries), convert_to_numpy=True, normalize_embeddings=True,
+                               batch_size=max(1, len(queries)))
+
+_batcher = MicroBatcher(encode_queries, EMBED_BATCH_MAX_SIZE, EMBED_BATCH_MAX_WAIT_MS) if EMBED_BATCH_MAX_SIZE > 1 else None
+
+# The default KB loads at import (and is never unloaded); others on first use.
+get_tenant()
+
+def get_query_embedding(query: str):
+    key = normalize_query(query)
+    cached = _query_cache.get(key)
+    if cached is not None:
+        return cached
+    with span("encode"):
+        if _batcher is not None:
+            q_emb = _batcher.encode(query)
+        else:
+            q_emb = get_embedder().encode(query, convert_to_numpy=True, normalize_embeddings=True)
     if q_emb.ndim == 2:
         q_emb = q_emb[0]
-    q = q_emb / (np.linalg.norm(q_emb) + 1e-12)
-    _query_cache[query] = q
+    q = (q_emb / (np.linalg.norm(q_emb) + 1e-12)).astype(np.float32)
+    q.flags.writeable = False
+    _query_cache.set(key, q)
     return q
 
-# --- Helper functions ---
-def is_greeting(text: str) -> bool:
-    if not text:
-        return False
-    t = text.lower().strip()
-    for pat in GREETING_PATTERNS:
-        if re.search(pat, t):
-            return True
-    return len(t.split()) <= 2 and t in {"hey", "hi", "hello", "hiya", "how are you", "how r u"}
-
-def extract_most_recent_year(text: str) -> Optional[int]:
-    if not text:
-        return None
-    years = re.findall(r"(?:19|20)\d{2}", text)
-    return max(map(int, years)) if years else None
-
-def is_work_intent(text: str) -> bool:
-    if not text:
-        return False
-    t = text.lower()
-    return any(re.search(pat, t) for pat in WORK_INTENT_PATTERNS)
-
-def normalize_rows(x):
-    x = np.asarray(x, dtype=np.float32)
-    norms = np.linalg.norm(x, axis=1, keepdims=True) + 1e-12
-    return x / norms
-
-kb_embeddings = normalize_rows(kb_embeddings)
-title_embeddings = normalize_rows(title_embeddings)
-
-def get_top_k(query: str, k: int = TOP_K):
-    q = get_query_embedding(query)
-    sim_text = np.dot(kb_embeddings, q)
-    sim_title = np.dot(title_embeddings, q)
-    combined = ALPHA_TEXT * sim_text + BETA_TITLE * sim_title
-
-    for idx, it in enumerate(kb_items):
-        priority = float(it.get("priority", 0.0) or 0.0)
-        combined[idx] += GAMMA_PRIORITY * priority
-        item_id = it.get("id")
-        if item_id in ID_BOOSTS:
-            combined[idx] += float(ID_BOOSTS[item_id])
-        year = it.get("year") or extract_most_recent_year(it.get("text", ""))
-        if year:
-            combined[idx] += max(0, int(year) - RECENCY_BASE_YEAR) * RECENCY_SCALE
-
-    idxs = np.argsort(-combined)[:k]
-    return idxs, combined[idxs]
-
-# --- OpenAI call helper ---
-def call_openai_chat(prompt: str, model: str = OPENAI_MODEL, timeout: int = 60):
-    if not OPENAI_API_KEY:
-        raise RuntimeError("OpenAI API key not configured.")
-    messages = [
-        {"role": "system", "content":
-            "You are Omar Dalal's portfolio assistant. Use the provided context to answer questions accurately. "
-            "The context contains verified information about Omar's background, skills, experience, education, and projects. "
-            "Always prioritize information from the context. If asked about Omar's name, respond 'Omar Dalal'. "
-            "Be conversational, helpful, and provide detailed answers when the context supports it. "
-            "If the context doesn't contain the answer, say you don't have that information."},
+def get_query_embeddings(queries) -> np.ndarray:
+    # Batched get_query_embedding: cached vectors are reused and all misses go
+    # through a single encode call. Returns an (m, dim) matrix.
+    keys = [normalize_query(query) for query in queries]
+    found = {key: _query_cache.get(key) for key in keys}
+    missing = {}
+    for key, query in zip(keys, queries):
+        if found[key] is None:
+            missing.setdefault(key, query)
+    if missing:
+        with span("encode"):
+            embs = np.asarray(encode_queries(list(missing.values())), dtype=np.float32)
+        embs /= np.linalg.norm(embs, axis=1, keepdims=True) + 1e-12
+        for key, row in zip(missing, embs):
+            q = np.array(row)
+            q.flags.writeable = False
+            _query_cache.set(key, q)
+            found[key] = q
+    if not keys:
+        return np.empty((0, get_tenant().kb.store.dim), dtype=np.float32)
+    return np.stack([found[key] for key in keys])
+
+# --- Intent routing ---
+intent_router = load_router(DEFAULT_INTENTS, INTENTS_PATH)
+
+# --- OpenAI call helpers ---
+SYSTEM_PROMPT = (
+    "You are Omar Dalal's portfolio assistant. Use the provided context to answer questions accurately. "
+    "The context contains verified information about Omar's background, skills, experience, education, and projects. "
+    "Always prioritize information from the context. If asked about Omar's name, respond 'Omar Dalal'. "
+    "Be conversational, helpful, and provide detailed answers when the context supports it. "
+    "If the context doesn't contain the answer, say you don't have that information."
+)
+
+def build_messages(prompt: str):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
         {"role": "user", "content": prompt},
     ]
-    response = client.chat.completions.create(
-        model=model,
-        messages=messages,
-        max_tokens=1500,
-        temperature=0.3,
-        timeout=timeout,
-    )
-    return response.choices[0].message.content
+
+def llm_params(model: str, timeout: int) -> dict:
+    return dict(model=model, max_tokens=LLM_MAX_TOKENS, temperature=LLM_TEMPERATURE, timeout=timeout)
+
+def call_openai_chat(prompt: str, model: str = OPENAI_MODEL, timeout: int = 60):
+    with span("llm"):
+        return llm.complete(build_messages(prompt), **llm_params(model, timeout))
+
+def stream_openai_chat(prompt: str, model: str = OPENAI_MODEL, timeout: int = 60):
+    # Yields content deltas as they arrive. Closing the generator (e.g. when the
+    # client disconnects) closes the upstream HTTP stream too.
+    yield from llm.stream(build_messages(prompt), **llm_params(model, timeout))
+
+# --- Query pipeline ---
+NO_RESULTS_ANSWER = "I couldn't find relevant information in my knowledge base about that."
+
+def build_prompt(question: str, top_items) -> str:
+    packed = pack_context(top_items, CONTEXT_TOKEN_BUDGET)
+    metrics.CONTEXT_TOKENS.observe(packed["tokens"])
+    if packed["dropped"]:
+        logger.debug("Context budget %d: dropped %s", CONTEXT_TOKEN_BUDGET, packed["dropped"])
+    context_str = packed["context"]
+
+    return f"""Based on the following verified information about Omar Dalal, answer the user's question accurately and conversationally.
+
+Context:
+{context_str}
+
+User question: "{question}"
+
+Provide a helpful, detailed answer based on the context above."""
+
+def retrieval_k(intent, top_k: int) -> int:
+    return max(top_k, 7) if intent.has("work") else top_k
+
+def lexical_only(kb, question: str) -> bool:
+    return (LEXICAL_PREFILTER and kb.lexical is not None
+            and kb.lexical.is_keyword_query(question, max_terms=LEXICAL_PREFILTER_MAX_TERMS))
+
+def lexical_search(kb, question: str, k: int):
+    with span("lexical"):
+        return kb.lexical.search(query_terms(question), k)[0]
+
+def fuse(kb, question: str, dense_idxs, k: int):
+    # dense_idxs: the dense ranking, HYBRID_CANDIDATES deep when hybrid
+    if kb.lexical is None:
+        return dense_idxs[:k]
+    lexical_idxs = lexical_search(kb, question, len(dense_idxs))
+    if not len(lexical_idxs):
+        return dense_idxs[:k]
+    idxs, _ = rrf_fuse([dense_idxs, lexical_idxs], [HYBRID_DENSE_WEIGHT, HYBRID_LEXICAL_WEIGHT], k, RRF_K)
+    return idxs
+
+def retrieve(kb, question: str, k: int):
+    # -> (query embedding, ranked rows). The embedding is None when the lexical
+    # prefilter answered the query without the embedder.
+    if lexical_only(kb, question):
+        idxs = lexical_search(kb, question, k)
+        if len(idxs):
+            return None, idxs
+    q = get_query_embedding(question)
+    with span("retrieval"):
+        idxs, _ = kb.index.search(q, dense_depth(kb, k))
+    return q, fuse(kb, question, idxs, k)
+
+def dense_depth(kb, k: int) -> int:
+    return max(k, HYBRID_CANDIDATES) if kb.lexical is not None else k
+
+def prepare_query(question: str, top_k: int = TOP_K, kb_name: str = None) -> dict:
+    # Everything up to the LLM call. Returns {"answer": ...} when the question
+    # can be answered without the LLM, otherwise {"prompt", "sources", "cache_key"}.
+    tenant = get_tenant(kb_name)
+    with span("intent"):
+        intent = intent_router.route(question)
+    if intent.answer is not None:
+        return {"answer": intent.answer}
+
+    kb = tenant.kb
+    q, idxs = retrieve(kb, question, retrieval_k(intent, top_k))
+    return plan_answer(tenant, kb, question, intent, q, idxs)
+
+def prepare_queries(questions, top_k: int = TOP_K, kb_name: str = None) -> list:
+    # Batched prepare_query: one encode for every question that needs the
+    # embedder and one scoring pass over the KB for all of them.
+    tenant = get_tenant(kb_name)
+    with span("intent"):
+        intents = [intent_router.route(question) for question in questions]
+    plans = [{"answer": intent.answer} if intent.answer is not None else None for intent in intents]
+    kb = tenant.kb
+    pending = []
+    for i, plan in enumerate(plans):
+        if plan is not None:
+            continue
+        if lexical_only(kb, questions[i]):
+            idxs = lexical_search(kb, questions[i], retrieval_k(intents[i], top_k))
+            if len(idxs):
+                plans[i] = plan_answer(tenant, kb, questions[i], intents[i], None, idxs)
+                continue
+        pending.append(i)
+    if not pending:
+        return plans
+
+    queries = get_query_embeddings([questions[i] for i in pending])
+    ks = [retrieval_k(intents[i], top_k) for i in pending]
+    with span("retrieval"):
+        hits = kb.index.search_many(queries, dense_depth(kb, max(ks)))
+    for i, q, k, (idxs, _) in zip(pending, queries, ks, hits):
+        plans[i] = plan_answer(tenant, kb, questions[i], intents[i], q, fuse(kb, questions[i], idxs, k))
+    return plans
+
+def plan_answer(tenant, kb, question: str, intent, q, idxs) -> dict:
+    idxs = list(idxs)
+
+    # For work queries, ensure key work experiences are included
+    if intent.has("work"):
+        for fid in ("humly", "outliar"):
+            found_index = kb.item_index.get(fid)
+            if found_index is not None and found_index not in idxs:
+                idxs.append(found_index)
+        idxs = idxs[:min(len(idxs), 10)]
+
+    if not idxs:
+        return {"answer": NO_RESULTS_ANSWER}
+
+    top_items = [kb.items[i] for i in idxs]
+    sources = [it.get('title', '') for it in top_items[:3]]
+
+    item_ids = [it.get("id") for it in top_items]
+    with span("answer_cache"):
+        cache_key = tenant.answer_cache.key(question, item_ids, OPENAI_MODEL, kb.version)
+        cached = tenant.answer_cache.get(cache_key)
+    if cached is not None:
+        return {"answer": cached["answer"], "sources": cached["sources"], "cached": True}
+
+    # keyword queries answered from BM25 alone have no embedding to compare
+    audit_answer = None
+    similar = None
+    if q is not None:
+        with span("semantic_cache"):
+            similar = tenant.semantic_cache.lookup(q, item_ids, OPENAI_MODEL)
+    if similar is not None:
+        if not similar["audit"]:
+            return {"answer": similar["answer"], "sources": similar["sources"], "cached": True}
+        audit_answer = similar["answer"]
+
+    with span("prompt_build"):
+        prompt = build_prompt(question, top_items)
+
+    return {"prompt": prompt, "sources": sources, "cache_key": cache_key, "tenant": tenant, "kb_version": kb.version,
+            "query_embedding": q, "item_ids": item_ids, "audit_answer": audit_answer}
+
+def record_answer(plan: dict, answer: str):
+    # Store a fresh LLM answer for a prepared query in both answer caches.
+    if not answer:
+        return
+    tenant = plan["tenant"]
+    if plan["kb_version"] != tenant.kb.version:
+        return  # the KB was reloaded while this answer was generated
+    tenant.answer_cache.set(plan["cache_key"], answer, plan["sources"])
+    if plan.get("audit_answer") is not None:
+        try:
+            sim = tenant.semantic_cache.audit(plan["audit_answer"], answer)
+            logger.info("Semantic cache audit: cached vs fresh answer similarity %.3f", sim)
+        except Exception as e:
+            logger.warning("Semantic cache audit failed: %s", e)
+    elif plan["query_embedding"] is not None:
+        tenant.semantic_cache.add(plan["query_embedding"], plan["item_ids"], OPENAI_MODEL, answer, plan["sources"])
+
+# --- KB hot reload ---
+def reload_kb(force: bool = False, kb_name: str = None) -> dict:
+    # Loads the KB's store side by side with the active version, validates it
+    # and swaps it in. Requests already running keep the KnowledgeBase they
+    # started with. Raises ValueError / FileNotFoundError if the new store
+    # can't be served, UnknownKB for unknown names.
+    tenant = get_tenant(kb_name)
+    with tenant.reload_lock:
+        current = tenant.kb
+        result = {"kb": tenant.name, "reloaded": False, "kb_version": current.version}
+        if not force and stored_version(tenant.kb_dir) == current.version:
+            return result
+        t0 = time.perf_counter()
+        with span("kb_reload"):
+            kb = load_kb(tenant.kb_dir)
+            validate_kb(kb, current)
+        if kb.version == current.version and not force:
+            return result
+        tenant.kb = kb
+        tenant.answer_cache.set_version(kb.version)
+        tenant.semantic_cache.clear()
+        seconds = time.perf_counter() - t0
+        logger.info("KB %r reloaded: %s -> %s, %d items, %s index, %.2fs",
+                    tenant.name, current.version, kb.version, len(kb), kb.index.kind, seconds)
+        return dict(result, reloaded=True, kb_version=kb.version, previous_version=current.version,
+                    items=len(kb), seconds=round(seconds, 3))
+
+def watch_kb(interval: float):
+    # Polls every resident KB; KBs that aren't loaded are read fresh on first
+    # use anyway. embed.py replaces kb_meta.json last, so a new version there
+    # means the rebuild is complete. A version that fails validation is not retried.
+    failed = {}
+    while True:
+        time.sleep(interval)
+        for tenant in kb_registry.resident():
+            version = stored_version(tenant.kb_dir)
+            if version is None or version in (tenant.kb.version, failed.get(tenant.name)):
+                continue
+            try:
+                reload_kb(kb_name=tenant.name)
+            except Exception as e:
+                logger.error("KB %r reload of version %s failed (%s); still serving %s",
+                             tenant.name, version, e, tenant.kb.version)
+                failed[tenant.name] = version
+
+if KB_RELOAD_INTERVAL > 0:
+    threading.Thread(target=watch_kb, args=(KB_RELOAD_INTERVAL,), name="kb-watcher", daemon=True).start()
+
+def admin_authorized(authorization: str) -> bool:
+    if not ADMIN_TOKEN:
+        return False
+    return hmac.compare_digest((authorization or "").encode("utf-8"), f"Bearer {ADMIN_TOKEN}".encode("utf-8"))
+
+# --- Batch queries ---
+def plan_batch(questions, top_k: int = TOP_K, kb_name: str = None):
+    # Returns (results, jobs). results has one dict per question, already
+    # holding the answer where no LLM call is needed; jobs maps each distinct
+    # prompt to (plan, [result indices]) so repeated questions share one call.
+    results = [{"question": question} for question in questions]
+    asked = [i for i, question in enumerate(questions) if question]
+    for i, question in enumerate(questions):
+        if not question:
+            results[i]["error"] = "Missing question"
+
+    jobs = {}
+    plans = prepare_queries([questions[i] for i in asked], top_k, kb_name)
+    for i, plan in zip(asked, plans):
+        if "prompt" not in plan:
+            results[i].update(plan)
+        else:
+            jobs.setdefault(plan["cache_key"], (plan, []))[1].append(i)
+    return results, list(jobs.values())
+
+def answer_batch(questions, top_k: int = TOP_K, concurrency: int = BATCH_LLM_CONCURRENCY,
+                 kb_name: str = None) -> list:
+    results, jobs = plan_batch(questions, top_k, kb_name)
+
+    def run(job):
+        plan, indices = job
+        try:
+            answer = call_openai_chat(plan["prompt"], model=OPENAI_MODEL, timeout=OLLAMA_TIMEOUT).strip()
+            record_answer(plan, answer)
+            outcome = {"answer": answer, "sources": plan["sources"]}
+        except Exception as e:
+            logger.warning("Batch question failed: %s", e)
+            outcome = {"error": str(e)}
+        for i in indices:
+            results[i].update(outcome)
+
+    if jobs:
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(jobs)))) as pool:
+            list(pool.map(run, jobs))
+    return results
+
+def cache_stats() -> dict:
+    # "answers" / "semantic_answers" are the default KB's; "kbs" has every resident KB
+    default = get_tenant()
+    return {
+        "query_embeddings": _query_cache.stats(),
+        "answers": default.answer_cache.stats(),
+        "semantic_answers": default.semantic_cache.stats(),
+        "embed_batching": _batcher.stats() if _batcher is not None else None,
+        "kbs": {tenant.name: {"answers": tenant.answer_cache.stats(),
+                              "semantic_answers": tenant.semantic_cache.stats()}
+                for tenant in kb_registry.resident()},
+    }
+
+def numeric_stats(stats):
+    for field, value in (stats or {}).items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield field, value
+
+def collect_cache_metrics():
+    stats = cache_stats()
+    for cache in ("query_embeddings", "embed_batching"):
+        for field, value in numeric_stats(stats[cache]):
+            yield f"chatbot_cache_{field}", {"cache": cache}, value, f"Cache statistic '{field}'"
+    for kb, caches in stats["kbs"].items():
+        for cache, kb_stats in caches.items():
+            for field, value in numeric_stats(kb_stats):
+                yield f"chatbot_cache_{field}", {"cache": cache, "kb": kb}, value, f"Cache statistic '{field}'"
+
+metrics.register_collector(collect_cache_metrics)
+
+def collect_kb_metrics():
+    for field, value in kb_registry.stats().items():
+        yield f"chatbot_kbs_{field}", {}, value, f"KB registry: {field.replace('_', ' ')}"
+    for tenant in kb_registry.resident():
+        yield "chatbot_kb_items", {"kb": tenant.name}, len(tenant.kb), "Items in each resident KB"
+
+metrics.register_collector(collect_kb_metrics)
+
+def collect_llm_metrics():
+    for field, value in llm.stats().items():
+        yield f"chatbot_llm_{field}", {}, value, f"LLM gateway: {field.replace('_', ' ')} since start"
+
+metrics.register_collector(collect_llm_metrics)
+
+# --- Warmup & readiness ---
+_warmup = {"state": "pending", "seconds": None, "error": None, "over_budget": False}
+_warmup_lock = threading.Lock()
+
+def warm_up():
+    t0 = time.perf_counter()
+    try:
+        with span("warmup"):
+            encode_queries(["warmup query"])
+    except Exception as e:
+        logger.exception("Embedder warmup failed")
+        with _warmup_lock:
+            _warmup.update(state="failed", error=str(e))
+        return
+    seconds = time.perf_counter() - t0
+    over_budget = 0 < EMBEDDER_STARTUP_BUDGET < seconds
+    with _warmup_lock:
+        _warmup.update(state="ready", seconds=round(seconds, 3), error=None, over_budget=over_budget)
+    if over_budget:
+        logger.warning("Embedder (%s) warm after %.2fs, over the %.2fs startup budget",
+                       EMBEDDER_BACKEND, seconds, EMBEDDER_STARTUP_BUDGET)
+    else:
+        logger.info("Embedder (%s) warm after %.2fs", EMBEDDER_BACKEND, seconds)
+
+def start_warmup():
+    with _warmup_lock:
+        if _warmup["state"] not in ("pending", "failed"):
+            return
+        _warmup["state"] = "running"
+    threading.Thread(target=warm_up, name="embedder-warmup", daemon=True).start()
+
+def readiness():
+    # (ready, details). The KB is loaded at import, so readiness waits on the
+    # embedder; in lazy mode the first probe starts the warmup.
+    with _warmup_lock:
+        state = dict(_warmup)
+    if state["state"] in ("pending", "failed"):
+        start_warmup()
+    kb = get_tenant().kb
+    details = {
+        "ready": state["state"] == "ready",
+        "kb_items": len(kb),
+        "kb_version": kb.version,
+        "kbs_resident": [tenant.name for tenant in kb_registry.resident()],
+        "embedder": state["state"],
+        "embedder_backend": EMBEDDER_BACKEND,
+        "warmup_seconds": state["seconds"],
+    }
+    if EMBEDDER_STARTUP_BUDGET > 0:
+        details["warmup_over_budget"] = state["over_budget"]
+    if state["error"]:
+        details["error"] = state["error"]
+    return details["ready"], details
+
+def collect_warmup_metrics():
+    with _warmup_lock:
+        state = dict(_warmup)
+    yield "chatbot_ready", {}, int(state["state"] == "ready"), "1 once the KB and embedder are loaded"
+    if state["seconds"] is not None:
+        yield "chatbot_warmup_seconds", {"backend": EMBEDDER_BACKEND}, state["seconds"], "Embedder load + first encode duration"
+
+metrics.register_collector(collect_warmup_metrics)
+
+if EMBEDDER_WARMUP:
+    start_warmup()
+
+def kb_param(data: dict, args=None):
+    # "kb" from the JSON body, else from the query string; None = DEFAULT_KB
+    name = str(data.get("kb") or (args or {}).get("kb") or "").strip()
+    return name or None
+
+def unknown_kb_error(e: UnknownKB) -> dict:
+    return {"error": f"Unknown knowledge base {e.args[0]!r}"}
+
+def sse_event(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
 
 # --- Flask routes ---
 @app.route("/", methods=["GET"])
@@ -179,6 +720,8 @@ def home():
       <body>
         <h1>Flask backend is running</h1>
         <p>This server exposes a POST endpoint <code>/api/query</code> for the chatbot.</p>
+        <p>Streaming (Server-Sent Events) answers are available from <code>/api/query/stream</code>.</p>
+        <p>Many questions at once: POST <code>{"questions": [...]}</code> to <code>/api/query/batch</code>.</p>
       </body>
     </html>
     """
@@ -188,79 +731,173 @@ def home():
 def favicon():
     return Response(status=204)
 
+@app.after_request
+def count_request(response):
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    metrics.REQUESTS.inc(route=route, status=response.status_code)
+    return response
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    return jsonify({"status": "ok"})
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    ready, details = readiness()
+    return jsonify(details), (200 if ready else 503)
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.route("/api/cache", methods=["GET"])
+def api_cache_stats():
+    return jsonify(cache_stats())
+
+@app.route("/api/kb/reload", methods=["POST"])
+def api_kb_reload():
+    # Reloads this worker only; with several workers use KB_RELOAD_INTERVAL.
+    if not admin_authorized(request.headers.get("Authorization", "")):
+        return jsonify({"error": "Forbidden"}), 403
+    data = request.get_json(silent=True) or {}
+    kb_name = kb_param(data, request.args)
+    try:
+        return jsonify(reload_kb(bool(data.get("force")), kb_name))
+    except UnknownKB as e:
+        return jsonify(unknown_kb_error(e)), 404
+    except (ValueError, FileNotFoundError) as e:
+        logger.warning("KB reload rejected: %s", e)
+        return jsonify({"error": str(e), "kb_version": get_tenant(kb_name).kb.version}), 422
+
 @app.route("/api/query", methods=["GET"])
 def api_query_get():
     return jsonify({"error": "POST JSON required"}), 400
 
-@app.route("/api/query", methods=["POST"])
-def api_query():
+def parse_query_request():
     data = request.get_json() or {}
     question = (data.get("question") or "").strip()
     top_k = int(data.get("top_k", TOP_K))
-    if not question:
-        return jsonify({"error": "Missing question"}), 400
-
-    q_lower = question.lower()
-
-    # Only handle explicit name questions directly
-    for pat in NAME_PATTERNS:
-        if re.search(pat, q_lower):
-            return jsonify({"answer": "I'm Omar Dalal's portfolio assistant. You can ask me about Omar's skills, experience, projects, education, and more!"})
-
-    if is_greeting(question):
-        return jsonify({"answer": "Hi! 👋 I'm Omar Dalal's portfolio assistant. Ask me anything about Omar's experience, skills, projects, or background!"})
-
-    work_query = is_work_intent(question)
-    retrieval_k = max(top_k, 7) if work_query else top_k
+    # "timing": true adds a per-stage latency breakdown (ms) to the response
+    return question, top_k, bool(data.get("timing")), kb_param(data, request.args)
 
-    try:
-        idxs, scores = get_top_k(question, retrieval_k)
-        idxs = list(idxs)
-
-        # For work queries, ensure key work experiences are included
-        if work_query:
-            for fid in ("humly", "outliar"):
-                found_index = next((i for i, it in enumerate(kb_items) if it.get("id") == fid), None)
-                if found_index is not None and found_index not in idxs:
-                    idxs.append(found_index)
-            idxs = idxs[:min(len(idxs), 10)]
-
-        if not idxs:
-            return jsonify({"answer": "I couldn't find relevant information in my knowledge base about that."})
-
-        top_items = [kb_items[i] for i in idxs]
-        
-        # Build rich context with clear structure
-        context_parts = []
-        for it in top_items:
-            title = it.get('title', '')
-            summary = it.get('summary', '')
-            text = it.get('text', '')
-            
-            part = f"## {title}\n"
-            if summary:
-                part += f"**Summary:** {summary}\n\n"
-            if text:
-                part += f"{text}\n"
-            context_parts.append(part)
-        
-        context_str = "\n---\n".join(context_parts)[:MAX_CONTEXT_CHARS]
-
-        prompt = f"""Based on the following verified information about Omar Dalal, answer the user's question accurately and conversationally.
-
-Context:
-{context_str}
-
-User question: "{question}"
+@app.route("/api/query", methods=["POST"])
+def api_query():
+    if request.accept_mimetypes.best == "text/event-stream":
+        return api_query_stream()
 
-Provide a helpful, detailed answer based on the context above."""
+    question, top_k, want_timing, kb_name = parse_query_request()
+    if not question:
+        return jsonify({"error": "Missing question"}), 400
 
-        stdout = call_openai_chat(prompt, model=OPENAI_MODEL, timeout=OLLAMA_TIMEOUT).strip()
+    with trace_request() as trace:
+        try:
+            plan = prepare_query(question, top_k, kb_name)
+            if "prompt" not in plan:
+                result = dict(plan)
+            else:
+                stdout = call_openai_chat(plan["prompt"], model=OPENAI_MODEL, timeout=OLLAMA_TIMEOUT).strip()
+                record_answer(plan, stdout)
+                result = {"answer": stdout, "sources": plan["sources"]}
+        except UnknownKB as e:
+            return jsonify(unknown_kb_error(e)), 404
+        except Exception as e:
+            logger.exception("Unhandled error")
+            return jsonify({"error": str(e)}), 500
+        if want_timing:
+            result["timing"] = trace.as_ms()
+        return jsonify(result)
+
+def parse_batch_request(data: dict, args=None):
+    # -> (questions, top_k, concurrency, want_timing, kb) or an error message
+    questions = data.get("questions")
+    if not isinstance(questions, list) or not questions:
+        return "Missing questions"
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        return f"At most {BATCH_MAX_QUESTIONS} questions per batch"
+    questions = [str(q or "").strip() for q in questions]
+    top_k = int(data.get("top_k", TOP_K))
+    concurrency = max(1, min(int(data.get("concurrency", BATCH_LLM_CONCURRENCY)), BATCH_LLM_CONCURRENCY))
+    return questions, top_k, concurrency, bool(data.get("timing")), kb_param(data, args)
+
+@app.route("/api/query/batch", methods=["POST"])
+def api_query_batch():
+    parsed = parse_batch_request(request.get_json() or {}, request.args)
+    if isinstance(parsed, str):
+        return jsonify({"error": parsed}), 400
+    questions, top_k, concurrency, want_timing, kb_name = parsed
+
+    with trace_request() as trace:
+        try:
+            results = answer_batch(questions, top_k, concurrency, kb_name)
+        except UnknownKB as e:
+            return jsonify(unknown_kb_error(e)), 404
+        except Exception as e:
+            logger.exception("Unhandled error")
+            return jsonify({"error": str(e)}), 500
+        result = {"results": results}
+        if want_timing:
+            result["timing"] = trace.as_ms()
+        return jsonify(result)
+
+@app.route("/api/query/stream", methods=["POST"])
+def api_query_stream():
+    # Server-Sent Events: "sources" first, then one "token" event per delta,
+    # then "done" with the full answer (or "error" if generation fails).
+    question, top_k, want_timing, kb_name = parse_query_request()
+    if not question:
+        return jsonify({"error": "Missing question"}), 400
 
-        return jsonify({"answer": stdout, "sources": [it.get('title', '') for it in top_items[:3]]})
-    except Exception as e:
-        logger.exception("Unhandled error")
-        return jsonify({"error": str(e)}), 500
+    with trace_request() as trace:
+        try:
+            plan = prepare_query(question, top_k, kb_name)
+        except UnknownKB as e:
+            return jsonify(unknown_kb_error(e)), 404
+        except Exception as e:
+            logger.exception("Unhandled error")
+            return jsonify({"error": str(e)}), 500
+
+    def done_event(payload):
+        if want_timing:
+            payload["timing"] = trace.as_ms()
+        return sse_event("done", payload)
+
+    def generate():
+        yield sse_event("sources", {"sources": plan.get("sources", [])})
+        if "prompt" not in plan:
+            yield sse_event("token", {"text": plan["answer"]})
+            yield done_event({"answer": plan["answer"], "cached": bool(plan.get("cached"))})
+            return
+
+        parts = []
+        t0 = time.perf_counter()
+        tokens = stream_openai_chat(plan["prompt"], model=OPENAI_MODEL, timeout=OLLAMA_TIMEOUT)
+        try:
+            for delta in tokens:
+                if not parts:
+                    ttft = time.perf_counter() - t0
+                    metrics.observe("llm_first_token", ttft)
+                    trace.add("llm_first_token", ttft)
+                parts.append(delta)
+                yield sse_event("token", {"text": delta})
+        except GeneratorExit:
+            logger.info("Client disconnected mid-stream after %d chunks", len(parts))
+            raise
+        except Exception as e:
+            logger.exception("Error while streaming answer")
+            yield sse_event("error", {"error": str(e)})
+            return
+        finally:
+            tokens.close()
+
+        elapsed = time.perf_counter() - t0
+        metrics.observe("llm_stream", elapsed)
+        trace.add("llm_stream", elapsed)
+        answer = "".join(parts).strip()
+        record_answer(plan, answer)
+        yield done_event({"answer": answer, "cached": False})
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(generate(), mimetype="text/event-stream", headers=headers)
 
 if __name__ == "__main__":
     host = os.environ.get("FLASK_HOST", "0.0.0.0")
@@ -1,17 +1,29 @@
 #!/usr/bin/env bash
 set -euo pipefail
 
-echo "Starting Flask backend with Gunicorn..."
-
-# Number of Gunicorn workers (1 worker for low memory environments)
+# Number of workers (1 worker for low memory environments)
 WORKERS=${WEB_CONCURRENCY:-1}
 
-# Number of threads per worker
+# Number of threads per worker (WSGI mode only)
 THREADS=${GUNICORN_THREADS:-2}
 
 # Port Render expects
 PORT=${PORT:-5174}
 
+# SERVER_MODE=asgi serves asgi:app (async LLM calls) instead of the Flask app
+SERVER_MODE=${SERVER_MODE:-wsgi}
+
+if [ "$SERVER_MODE" = "asgi" ]; then
+    echo "Starting ASGI backend with Uvicorn..."
+    exec uvicorn asgi:app \
+        --host 0.0.0.0 \
+        --port $PORT \
+        --workers $WORKERS \
+        --timeout-keep-alive 30
+fi
+
+echo "Starting Flask backend with Gunicorn..."
+
 exec gunicorn server:app \
     --bind 0.0.0.0:$PORT \
     --workers $WORKERS \
@@ -0,0 +1,162 @@
+# vector_index.py
+# Dense retrieval index layer used by server.retrieve. Both indexes return the
+# same ranking score (RankingModel: weighted text/title similarity + static
+# bias); they differ only in which rows get scored.
+#   exact - score every row (default)
+#   ivf   - inverted file: rows are clustered by k-means at build time (embed.py
+#           --index ivf) and a query only scores the rows of its nprobe nearest
+#           clusters, plus the rows with the largest static bias so boosted
+#           items can never be skipped.
+import json
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+
+from ranking import RankingModel, top_k_of
+
+logger = logging.getLogger(__name__)
+
+IVF_CENTROIDS_FILE = "kb_ivf_centroids.npy"
+IVF_OFFSETS_FILE = "kb_ivf_offsets.npy"
+IVF_ROWS_FILE = "kb_ivf_rows.npy"
+IVF_META_FILE = "kb_ivf.json"
+
+
+class ExactIndex:
+    kind = "exact"
+
+    def __init__(self, ranking: RankingModel):
+        self.ranking = ranking
+
+    def search(self, q: np.ndarray, k: int):
+        return self.ranking.top_k(q, k)
+
+    def search_many(self, queries: np.ndarray, k: int):
+        return self.ranking.top_k_many(queries, k)
+
+
+class IVFIndex:
+    kind = "ivf"
+
+    def __init__(self, ranking: RankingModel, centroids, offsets, rows,
+                 nprobe: int = 8, always_include: int = 64):
+        self.ranking = ranking
+        self.centroids = centroids
+        self.offsets = offsets
+        self.rows = rows
+        self.nprobe = max(1, min(int(nprobe), centroids.shape[0]))
+        n_always = min(int(always_include), len(ranking))
+        self.always = np.sort(top_k_of(ranking.bias, n_always)).astype(np.int64)
+
+    def candidates(self, q: np.ndarray) -> np.ndarray:
+        probes = top_k_of(self.centroids @ np.asarray(q, dtype=np.float32), self.nprobe)
+        parts = [self.rows[self.offsets[c]:self.offsets[c + 1]] for c in probes]
+        parts.append(self.always)
+        return np.unique(np.concatenate(parts))
+
+    def search(self, q: np.ndarray, k: int):
+        cand = self.candidates(q)
+        scores = self.ranking.matrix[cand] @ self.ranking.weighted_query(q) + self.ranking.bias[cand]
+        order = top_k_of(scores, k)
+        return cand[order], scores[order]
+
+    def search_many(self, queries: np.ndarray, k: int):
+        # Each query probes its own lists, so there is no shared product to batch.
+        return [self.search(q, k) for q in queries]
+
+
+# --- Build (embed.py) ---
+def item_directions(vectors: np.ndarray, start: int, stop: int) -> np.ndarray:
+    # One direction per item for clustering: normalized (text + title).
+    dim = vectors.shape[1] // 2
+    block = np.asarray(vectors[start:stop], dtype=np.float32)
+    x = block[:, :dim] + block[:, dim:]
+    return x / (np.linalg.norm(x, axis=1, keepdims=True) + 1e-12)
+
+
+def assign(vectors: np.ndarray, centroids: np.ndarray, chunk: int = 65536) -> np.ndarray:
+    out = np.empty(vectors.shape[0], dtype=np.int32)
+    for start in range(0, vectors.shape[0], chunk):
+        x = item_directions(vectors, start, start + chunk)
+        out[start:start + chunk] = np.argmax(x @ centroids.T, axis=1)
+    return out
+
+
+def build_ivf(vectors: np.ndarray, nlist: int, iters: int = 20, train_size: int = 256, seed: int = 0):
+    # Spherical k-means on a sample of at most train_size * nlist rows, then a
+    # chunked assignment of every row, so memory is bounded for large stores.
+    n = vectors.shape[0]
+    nlist = max(1, min(int(nlist), n))
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(n, size=min(n, train_size * nlist), replace=False))
+    train = item_directions(vectors[sample], 0, len(sample))
+    centroids = train[rng.choice(len(train), size=nlist, replace=False)].copy()
+    for _ in range(iters):
+        labels = np.argmax(train @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, train)
+        counts = np.bincount(labels, minlength=nlist)
+        empty = counts == 0
+        if empty.any():
+            # re-seed empty clusters with random training points
+            sums[empty] = train[rng.choice(len(train), size=int(empty.sum()), replace=False)]
+        centroids = sums / (np.linalg.norm(sums, axis=1, keepdims=True) + 1e-12)
+
+    labels = assign(vectors, centroids)
+    rows = np.argsort(labels, kind="stable").astype(np.int64)
+    offsets = np.zeros(nlist + 1, dtype=np.int64)
+    np.cumsum(np.bincount(labels, minlength=nlist), out=offsets[1:])
+    return centroids.astype(np.float32), offsets, rows
+
+
+def save_ivf(kb_dir: Path, store_version: str, centroids, offsets, rows):
+    # A running server may have the previous files memory-mapped: write temp
+    # files and os.replace them, never rewrite in place. The meta file goes
+    # first, so nothing loads the old version's meta with the new arrays.
+    kb_dir = Path(kb_dir)
+    (kb_dir / IVF_META_FILE).unlink(missing_ok=True)
+    for name, array in ((IVF_CENTROIDS_FILE, centroids), (IVF_OFFSETS_FILE, offsets), (IVF_ROWS_FILE, rows)):
+        tmp = kb_dir / (name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp, kb_dir / name)
+    tmp = kb_dir / (IVF_META_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"kind": "ivf", "nlist": int(centroids.shape[0]), "store_version": store_version}, f)
+    os.replace(tmp, kb_dir / IVF_META_FILE)
+
+
+def recall_at_k(exact: ExactIndex, approx, queries: np.ndarray, k: int) -> float:
+    hits = 0
+    for q in queries:
+        truth = set(exact.search(q, k)[0].tolist())
+        hits += len(truth & set(approx.search(q, k)[0].tolist()))
+    return hits / (len(queries) * k) if len(queries) else 1.0
+
+
+# --- Load (server.py) ---
+def load_index(kind: str, ranking: RankingModel, kb_dir, store_version: str, nprobe: int = 8):
+    kind = (kind or "exact").lower()
+    if kind == "exact":
+        return ExactIndex(ranking)
+    if kind != "ivf":
+        raise ValueError(f"Unknown index kind {kind!r} (expected 'exact' or 'ivf')")
+    kb_dir = Path(kb_dir)
+    meta_path = kb_dir / IVF_META_FILE
+    if not meta_path.exists():
+        logger.warning("IVF index requested but %s is missing; using exact search", meta_path)
+        return ExactIndex(ranking)
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("store_version") != store_version:
+        logger.warning("IVF index was built for another KB version; using exact search")
+        return ExactIndex(ranking)
+    return IVFIndex(
+        ranking,
+        np.load(kb_dir / IVF_CENTROIDS_FILE, mmap_mode="r"),
+        np.load(kb_dir / IVF_OFFSETS_FILE),
+        np.load(kb_dir / IVF_ROWS_FILE, mmap_mode="r"),
+        nprobe=nprobe,
+    )